@@ -4,7 +4,18 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 INBOX_DIR = os.path.join(DATA_DIR, "inbox")
-JOBS_LOG_PATH = os.path.join(DATA_DIR, "jobs.jsonl")
+JOBS_LOG_PATH = os.path.join(DATA_DIR, "jobs.jsonl")   # 旧版单文件日志，启动时迁移到分段目录
+JOBS_LOG_DIR = os.path.join(DATA_DIR, "jobs")          # 按天分段: jobs-YYYY-MM-DD.jsonl
+JOBS_INDEX_DB_PATH = os.path.join(DATA_DIR, "jobs_index.db")  # job_id -> 分段 + 偏移 索引
+JOB_LOG_COMPACT_AFTER_DAYS = 7     # 超过 N 天的分段压缩为只保留终态
+JOB_LOG_RETENTION_DAYS = 180       # 超过 N 天的分段直接删除
+JOB_STATUS_CACHE_SIZE = 50000               # 内存里保留最近多少个 job 的最新状态
+JOB_STATUS_BOOTSTRAP_BYTES = 16 * 1024 * 1024  # 启动时从日志尾部回放多少字节重建状态索引
+# 日志落盘策略：always=每条 fsync；batch=后台线程攒批，定时或遇到终态时 fsync；none=只 flush 不 fsync
+JOB_LOG_DURABILITY = "batch"
+JOB_LOG_FSYNC_INTERVAL = 0.5     # batch 模式下最长多久 fsync 一次 (秒)
+JOB_LOG_QUEUE_SIZE = 10000       # 后台写入队列上限，满了退化为同步写
+JOB_STREAM_MAX_SECONDS = 900     # /api/status/{job_id}/stream 单个连接最长推送时间
 OBSIDIAN_ROOT = "/home/heheheh/Documents/obsidian" # 你的实际路径
 KNOWLEDGE_STORE_ROOT = "/home/heheheh/Documents/knowledge_store"
 SPECIAL_USER = "scouthe"
@@ -12,6 +23,7 @@ SPECIAL_USER = "scouthe"
 # 自动创建必要目录
 os.makedirs(INBOX_DIR, exist_ok=True)
 os.makedirs(os.path.dirname(JOBS_LOG_PATH), exist_ok=True)
+os.makedirs(JOBS_LOG_DIR, exist_ok=True)
 
 # === 企业微信配置 ===
 CORP_ID = "wwa69b263cad69f601"
@@ -46,10 +58,105 @@ EMBEDDING_API_URL = "http://127.0.0.1:1234/v1"
 EMBEDDING_MODEL_NAME = "text-embedding-bge-m3" 
 
 CHROMA_COLLECTION_NAME = "knowledge_base"
+# 重复入库策略：skip=已收录直接跳过；if_changed=重新抓取，正文没变就跳过 AI/向量化；force=全部重做
+INGEST_FRESHNESS_POLICY = "skip"
+INGEST_FRESHNESS_TTL_DAYS = 30   # skip 策略下，超过这个天数的旧文档按 if_changed 处理
 MIN_CONTENT_LENGTH = 5  # 太短的内容不存向量库
 CHUNK_SIZE = 800          # 每一块大约 800 字符
 CHUNK_OVERLAP = 200       # 上下文重叠 200 字符
 
+# === Worker 并发配置 ===
+WORKER_CONCURRENCY = 4    # 同时在途的任务数 (worker 协程个数)
+CRAWL_CONCURRENCY = 4     # 抓取阶段并发上限
+LLM_CONCURRENCY = 1       # LLM 分析并发上限 (本地 14B 模型别压太狠)
+EMBED_CONCURRENCY = 2     # 落盘/向量化/索引写入并发上限
+
+# === LLM 网关 (所有 LLM/VLM 请求共用一个带优先级的并发闸门) ===
+LLM_GATEWAY_CONCURRENCY = 2        # 同时打到 LM Studio 的请求数
+LLM_GATEWAY_BACKGROUND_SLOTS = 1   # 后台请求 (入库分析/日报/VLM) 最多占几个槽，其余留给交互对话
+LLM_PRIORITIES = {"interactive": 0, "ingest": 1, "batch": 2}   # 数字越小越先拿到槽位
+
+# === 阻塞任务线程池/进程池 ===
+# kind: thread / process；max_queue: 排队上限，超过直接拒绝 (503)，避免请求无限堆积
+EXECUTOR_POOLS = {
+    "io": {"kind": "thread", "workers": 8, "max_queue": 64},      # 向量库/SQLite/文件/HTTP 等 IO
+    "cpu": {"kind": "process", "workers": 2, "max_queue": 16},    # MarkItDown、HTML 解析等纯 CPU
+    "model": {"kind": "thread", "workers": 2, "max_queue": 8},    # LLM/VLM/Whisper 等模型调用
+}
+
+# === 共享 HTTP 客户端 (长连接复用) ===
+# 每个 profile 一个 httpx 客户端，按 host 维护连接池；http2 需要安装 h2，没装自动退回 HTTP/1.1
+HTTP_CLIENT_PROFILES = {
+    "crawl": {"timeout": 30.0, "verify": False, "follow_redirects": True,
+              "max_connections": 64, "max_keepalive": 16, "keepalive_expiry": 30.0, "http2": True},
+    "jina": {"timeout": 30.0, "max_connections": 16, "max_keepalive": 8, "keepalive_expiry": 60.0, "http2": True},
+    "llm": {"timeout": 120.0, "max_connections": 8, "max_keepalive": 8, "keepalive_expiry": 300.0, "http2": False},
+    "wecom": {"timeout": 30.0, "max_connections": 8, "max_keepalive": 4, "keepalive_expiry": 60.0, "http2": True},
+}
+
+# === 抓取缓存 (压缩正文 + ETag/Last-Modified 条件请求) ===
+CRAWL_CACHE_DB_PATH = os.path.join(DATA_DIR, "crawl_cache.db")
+CRAWL_CACHE_FRESH_SECONDS = 3600          # 这段时间内直接用缓存，不发请求
+CRAWL_CACHE_TTL_DAYS = 14                 # 超过 N 天没访问的条目删除
+CRAWL_CACHE_MAX_BYTES = 512 * 1024 * 1024 # 压缩后总大小上限，超了按最久未访问淘汰
+
+# === 抓取限流 (按域名令牌桶 + 在途上限) ===
+# rate: 每秒补充令牌数；burst: 桶容量；max_inflight: 同一域名同时在途请求数
+CRAWL_HOST_LIMIT = {"rate": 1.0, "burst": 3, "max_inflight": 2}
+CRAWL_HOST_LIMIT_OVERRIDES = {   # 按域名后缀匹配，反爬严格的站点放慢
+    "zhihu.com": {"rate": 0.2, "burst": 1, "max_inflight": 1},
+    "mp.weixin.qq.com": {"rate": 0.5, "burst": 2, "max_inflight": 1},
+}
+CRAWL_JINA_LIMIT = {"rate": 0.3, "burst": 5, "max_inflight": 4}   # Jina 单独预算 (免费档约 20 次/分钟)
+CRAWL_BLOCK_COOLDOWN = 120   # 命中“安全验证”或 429 后该域名暂停的秒数
+
+HTML_EXTRACT_MAX_BYTES = 5 * 1024 * 1024   # 超过这个大小的页面不做本地抽取 (交给 Jina)
+# 流式下载上限：先看 Content-Length，边下边数，超过就中断连接
+CRAWL_MAX_PAGE_BYTES = 8 * 1024 * 1024
+CRAWL_MAX_DOC_BYTES = 50 * 1024 * 1024     # PDF/Office 链接，下载后走 MarkItDown
+
+# === 对冲抓取：本地抓取迟迟没结果时并行发起 Jina，谁先拿到可用正文用谁 ===
+CRAWL_HEDGE_DELAY = 5.0                   # 本地抓取开始多少秒后启动 Jina；None 表示关闭对冲 (串行兜底)
+CRAWL_HEDGE_PARALLEL_DOMAINS = {"zhihu.com"}   # 本地经常失败的站点，一开始就两路并发
+CRAWL_JINA_ONLY_DOMAINS = {"xiaohongshu.com", "xhslink.com"}   # 本地抓不了，直接走 Jina
+
+# === 订阅源 (RSS/Atom/站点地图) ===
+# 定时条件 GET，只把新条目入队 (source=feed，不在交互来源里，走批量优先级)
+FEEDS_DB_PATH = os.path.join(DATA_DIR, "feeds.db")
+FEED_POLL_TICK = 60                  # 轮询循环多久检查一次到期的订阅 (秒)
+FEED_DEFAULT_INTERVAL_MINUTES = 60
+FEED_MIN_INTERVAL_MINUTES = 10
+FEED_MAX_ERROR_BACKOFF_MINUTES = 24 * 60   # 连续失败按 interval * 2^n 退避，最长一天
+FEED_INITIAL_BACKFILL = 10           # 新订阅首次拉取时回填最近多少条，其余只标记为已读
+FEED_MAX_NEW_PER_POLL = 50           # 单次轮询最多入队条数，剩下的下轮再取
+FEED_SITEMAP_MAX_CHILDREN = 5        # 站点地图索引每轮最多展开几个子地图
+FEED_SEEN_RETENTION_DAYS = 180       # 已读条目记录保留天数
+
+# === 任务队列 (SQLite) ===
+QUEUE_DB_PATH = os.path.join(DATA_DIR, "queue.db")
+QUEUE_VISIBILITY_TIMEOUT = 300   # 认领后多少秒没续约就视为 worker 挂了，任务重新可见
+QUEUE_POLL_INTERVAL = 5.0        # 没有唤醒信号时的兜底轮询间隔 (秒)
+QUEUE_DONE_RETENTION_DAYS = 7    # 已完成任务保留天数，过期清理
+
+# 优先级通道：数字越小越优先。交互来源 (微信/网页速记) 插队到批量来源 (上传/重建/导入) 前面
+QUEUE_PRIORITY_INTERACTIVE = 0
+QUEUE_PRIORITY_BULK = 1
+QUEUE_INTERACTIVE_SOURCES = {"wechat", "api", "android_share", "voice"}
+QUEUE_PRIORITY_AGING = 120               # 防饿死：每低一档相当于晚入队 120 秒，等够了照样轮到
+QUEUE_INTERACTIVE_RESERVED_WORKERS = 1   # 预留给交互任务的 worker 数，批量任务再多也占不满
+
+# 失败重试：指数退避 base * 2^(n-1)，最多 QUEUE_MAX_ATTEMPTS 次，之后进死信 (dead)
+QUEUE_MAX_ATTEMPTS = 4
+QUEUE_RETRY_BASE_DELAY = 30      # 秒
+QUEUE_RETRY_MAX_DELAY = 1800     # 秒
+
+BATCH_INGEST_MAX_ITEMS = 1000    # /ingest/batch 单次最多条数 (不要超过 QUEUE_MAX_DEPTH_PER_USER_BULK)
+
+# 准入控制：排队 + 执行中的任务超过上限时返回 429 (带 Retry-After)
+QUEUE_MAX_DEPTH_GLOBAL = 2000
+QUEUE_MAX_DEPTH_PER_USER = 200        # 单用户交互通道 (单条分享/上传/语音/图片)
+QUEUE_MAX_DEPTH_PER_USER_BULK = 1000  # 单用户批量通道 (批量导入/订阅)，两条通道分开计，批量排满不影响单条分享
+
 # === API 安全配置 ===
 API_SECRET_KEY = "sk-123456" # 你自己随便设一个密码
 
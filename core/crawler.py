@@ -1,54 +1,336 @@
-import httpx
-import trafilatura
+import os
+import re
+import time
+import asyncio
+import tempfile
+import contextlib
+from urllib.parse import urlsplit, unquote
 from utils.helpers import sanitize_filename
-from config import FAKE_HEADERS, ZHIHU_COOKIE
+from utils.html_extract import extract_article
+from utils.doc_convert import convert_to_markdown
+from utils.http_client import get_async_client
+from utils.executors import run_blocking
+from utils import crawl_cache
+from utils.metrics import (
+    CRAWL_CACHE_REQUESTS, CRAWL_THROTTLE_SECONDS, CRAWL_BLOCKED, CRAWL_HEDGE_RESULTS, STAGE_SECONDS,
+    EXTRACT_SECONDS, EXTRACT_FALLBACKS,
+)
+from config import (
+    FAKE_HEADERS, ZHIHU_COOKIE,
+    CRAWL_HOST_LIMIT, CRAWL_HOST_LIMIT_OVERRIDES, CRAWL_JINA_LIMIT, CRAWL_BLOCK_COOLDOWN,
+    CRAWL_HEDGE_DELAY, CRAWL_HEDGE_PARALLEL_DOMAINS, CRAWL_JINA_ONLY_DOMAINS,
+    CRAWL_MAX_PAGE_BYTES, CRAWL_MAX_DOC_BYTES, HTML_EXTRACT_MAX_BYTES,
+)
 
-async def fetch_via_jina(url: str):
+# 可以交给 MarkItDown 的文档类型 -> 临时文件后缀
+DOC_CONTENT_TYPES = {
+    "application/pdf": ".pdf",
+    "application/msword": ".doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": ".docx",
+    "application/vnd.ms-powerpoint": ".ppt",
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": ".pptx",
+    "application/vnd.ms-excel": ".xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+}
+_TEXT_TYPES = ("text/", "application/xhtml", "application/xml", "application/json",
+               "application/rss+xml", "application/atom+xml")
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+class DownloadRejected(Exception):
+    """类型不支持或超过大小上限，提前中断下载"""
+
+class _HostLimiter:
+    """单个域名的令牌桶 + 在途上限；penalize 之后冷却期内一律不放行"""
+
+    def __init__(self, rate: float, burst: int, max_inflight: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()   # 排队等令牌，先到先得
+        self._inflight = asyncio.Semaphore(max_inflight)
+
+    async def _take(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, kind: str):
+        t0 = time.perf_counter()
+        async with self._inflight:
+            await self._take()
+            CRAWL_THROTTLE_SECONDS.observe(time.perf_counter() - t0, kind=kind)
+            yield
+
+    def penalize(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+_limiters: dict[str, _HostLimiter] = {}
+
+def _limiter_for(profile: str, url: str) -> _HostLimiter:
+    """Jina 共用一个预算；其余按域名 (命中 overrides 的按后缀合并，如 www/zhuanlan.zhihu.com)"""
+    if profile == "jina":
+        key, cfg = "jina", CRAWL_JINA_LIMIT
+    else:
+        host = (urlsplit(url).hostname or "").lower()
+        suffix = next((s for s in CRAWL_HOST_LIMIT_OVERRIDES if host == s or host.endswith("." + s)), None)
+        key, cfg = (suffix, CRAWL_HOST_LIMIT_OVERRIDES[suffix]) if suffix else (host, CRAWL_HOST_LIMIT)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = _HostLimiter(**cfg)
+    return limiter
+
+def _mark_blocked(profile: str, kind: str, url: str):
+    CRAWL_BLOCKED.inc(kind=kind)
+    _limiter_for(profile, url).penalize(CRAWL_BLOCK_COOLDOWN)
+    print(f"🚧 {urlsplit(url).hostname} 触发反爬，暂停 {CRAWL_BLOCK_COOLDOWN}s")
+
+def _decode(body: bytes, charset: str | None) -> str:
+    """响应头没给 charset 时看 <meta charset>，国内老站常见 gb2312/gbk，统一按 gb18030 解"""
+    if not charset:
+        m = _META_CHARSET.search(body[:4096])
+        charset = m.group(1).decode("ascii") if m else "utf-8"
+    if charset.lower() in ("gb2312", "gbk"):
+        charset = "gb18030"
+    try:
+        return body.decode(charset, errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+async def _read_capped(resp, content_type: str) -> bytes:
+    """按类型选上限：先看 Content-Length，再边读边数，超了立刻中断，内存占用有上界"""
+    if content_type in DOC_CONTENT_TYPES:
+        cap = CRAWL_MAX_DOC_BYTES
+    elif not content_type or content_type.startswith(_TEXT_TYPES):
+        cap = CRAWL_MAX_PAGE_BYTES
+    else:
+        raise DownloadRejected(f"不支持的类型 {content_type}")
+
+    length = resp.headers.get("content-length")
+    if length and length.isdigit() and int(length) > cap:
+        raise DownloadRejected(f"Content-Length {length} 超过上限 {cap}")
+    chunks, size = [], 0
+    async for chunk in resp.aiter_bytes():
+        size += len(chunk)
+        if size > cap:
+            raise DownloadRejected(f"下载超过上限 {cap} 字节，已中断")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def _cached_get(profile: str, kind: str, cache_url: str, request_url: str,
+                      headers: dict | None = None, force: bool = False) -> tuple[int, str, dict | None, dict | None]:
+    """
+    带缓存的流式 GET：新鲜期内直接返回缓存；过期则带 If-None-Match/If-Modified-Since 重新验证。
+    返回 (status, text, validators, document)：
+    - validators 不为 None 时调用方确认内容可用后再 _remember
+    - 文档类型 (PDF/Office) 不解码也不缓存，放在 document = {"suffix", "data"} 里
+    force=True 时跳过新鲜期，至少发一次条件请求。
+    """
+    try:
+        entry = await run_blocking("io", crawl_cache.lookup, kind, cache_url)
+    except Exception as e:
+        print(f"⚠️ 抓取缓存读取失败: {e}")
+        entry = None
+    if entry and entry["fresh"] and not force:
+        CRAWL_CACHE_REQUESTS.inc(kind=kind, result="hit")
+        return 200, entry["body"], None, None
+
+    req_headers = dict(headers or {})
+    if entry:
+        req_headers.update(crawl_cache.conditional_headers(entry))
+    async with _limiter_for(profile, request_url).slot(kind):
+        async with get_async_client(profile).stream("GET", request_url, headers=req_headers) as resp:
+            status = resp.status_code
+            content_type = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+            body = await _read_capped(resp, content_type) if status == 200 else b""
+            charset = resp.charset_encoding
+            validators = {"etag": resp.headers.get("etag"), "last_modified": resp.headers.get("last-modified")}
+    if status == 429:
+        _mark_blocked(profile, kind, request_url)
+    if status == 304 and entry:
+        CRAWL_CACHE_REQUESTS.inc(kind=kind, result="revalidated")
+        await run_blocking("io", crawl_cache.mark_revalidated, kind, cache_url)
+        return 200, entry["body"], None, None
+
+    CRAWL_CACHE_REQUESTS.inc(kind=kind, result="miss")
+    if content_type in DOC_CONTENT_TYPES:
+        return status, "", None, {"suffix": DOC_CONTENT_TYPES[content_type], "data": body}
+    return status, _decode(body, charset), validators, None
+
+async def _remember(kind: str, url: str, text: str, validators: dict | None):
+    """只缓存抽取成功的页面，避免把验证码页/错误页缓存下来"""
+    if validators is None:
+        return
+    try:
+        await run_blocking("io", crawl_cache.store, kind, url, text, validators["etag"], validators["last_modified"])
+    except Exception as e:
+        print(f"⚠️ 抓取缓存写入失败: {e}")
+
+async def fetch_via_jina(url: str, force: bool = False):
     """Jina Reader 抓取"""
     print(f">>> Jina 抓取: {url}")
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(f"https://r.jina.ai/{url}")
-            if resp.status_code == 200:
-                content = resp.text
-                if len(content) < 10: return None
-                
-                lines = content.split('\n')
-                title = lines[0].replace('# ', '').strip() if lines and lines[0].startswith('# ') else "Jina抓取"
-                
-                return {
-                    "type": "article",
-                    "title": sanitize_filename(title),
-                    "content": content,
-                    "url": url,
-                    "author": "Jina Reader",
-                    "site": "WebClip"
-                }
+        status, content, validators, _ = await _cached_get("jina", "jina", url, f"https://r.jina.ai/{url}", force=force)
+        if status == 200:
+            if len(content) < 10: return None
+            await _remember("jina", url, content, validators)
+            
+            lines = content.split('\n')
+            title = lines[0].replace('# ', '').strip() if lines and lines[0].startswith('# ') else "Jina抓取"
+            
+            return {
+                "type": "article",
+                "title": sanitize_filename(title),
+                "content": content,
+                "url": url,
+                "author": "Jina Reader",
+                "site": "WebClip"
+            }
     except Exception as e:
         print(f"❌ Jina 错误: {e}")
     return None
 
-async def fetch_via_trafilatura(url: str):
+async def _convert_document(url: str, document: dict) -> dict | None:
+    """PDF/Office 链接：落到临时文件，交给 MarkItDown (cpu 进程池)"""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=document["suffix"]) as tmp:
+        tmp.write(document["data"])
+        tmp_path = tmp.name
+    try:
+        text = await run_blocking("cpu", convert_to_markdown, tmp_path)
+    finally:
+        os.remove(tmp_path)
+    if not text or len(text.strip()) < 10:
+        return None
+    name = unquote(os.path.basename(urlsplit(url).path)) or "文档"
+    return {
+        "type": "article",
+        "category": "文章阅读",
+        "title": sanitize_filename(os.path.splitext(name)[0]) or "文档",
+        "content": text,
+        "url": url,
+        "author": "",
+        "site": urlsplit(url).hostname or "",
+    }
+
+async def fetch_via_trafilatura(url: str, force: bool = False):
     """本地抓取"""
     headers = FAKE_HEADERS.copy()
     if "zhihu.com" in url: headers["Cookie"] = ZHIHU_COOKIE
     
     try:
-        async with httpx.AsyncClient(verify=False, follow_redirects=True, timeout=30.0) as client:
-            resp = await client.get(url, headers=headers)
-            if resp.status_code == 200:
-                text = trafilatura.extract(resp.text, output_format="markdown", include_images=True, include_formatting=True, include_links=True)
-                meta = trafilatura.extract_metadata(resp.text)
-                if text and len(text) > 100 and "安全验证" not in text:
-                     return {
-                        "type": "article",
-                        "category": "文章阅读",
-                        "title": sanitize_filename(meta.title if meta else "无标题"),
-                        "content": text,
-                        "url": url,
-                        "author": meta.author if meta else "",
-                        "site": meta.sitename if meta else ""
-                    }
+        status, html, validators, document = await _cached_get("crawl", "page", url, url, headers=headers, force=force)
+        if status == 200 and document:
+            return await _convert_document(url, document)
+        if status == 200:
+            # 先在主进程卡大小，超限的页面不送进进程池 (跨进程要整页 pickle)，交给 Jina
+            if len(html.encode("utf-8", errors="ignore")) > HTML_EXTRACT_MAX_BYTES:
+                print(f"⚠️ 页面过大 ({len(html)} 字符)，跳过本地抽取")
+                return None
+            article = await run_blocking("cpu", extract_article, html, url)
+            if article:
+                EXTRACT_SECONDS.observe(article["seconds"], extractor=article["extractor"])
+                if article["fallback_from"]:
+                    EXTRACT_FALLBACKS.inc(extractor=article["fallback_from"])
+            text = article["text"] if article else ""
+            if text and "安全验证" in text:
+                _mark_blocked("crawl", "page", url)
+            elif text and len(text) > 100:
+                 await _remember("page", url, html, validators)
+                 return {
+                    "type": "article",
+                    "category": "文章阅读",
+                    "title": sanitize_filename(article["title"] or "无标题"),
+                    "content": text,
+                    "url": url,
+                    "author": article["author"],
+                    "site": article["sitename"]
+                }
+    except DownloadRejected as e:
+        print(f"⚠️ 本地抓取放弃 {url}: {e}")
     except Exception:
         pass
-    return None
\ No newline at end of file
+    return None
+
+async def fetch_feed(url: str, etag: str | None = None, last_modified: str | None = None) -> tuple[int, bytes, dict]:
+    """订阅源/站点地图：条件 GET，沿用同样的域名限流和大小上限，返回原始字节交给 XML 解析"""
+    headers = FAKE_HEADERS.copy()
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    async with _limiter_for("crawl", url).slot("feed"):
+        async with get_async_client("crawl").stream("GET", url, headers=headers) as resp:
+            status = resp.status_code
+            content_type = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+            body = await _read_capped(resp, content_type) if status == 200 else b""
+            validators = {"etag": resp.headers.get("etag"), "last_modified": resp.headers.get("last-modified")}
+    if status == 429:
+        _mark_blocked("crawl", "feed", url)
+    return status, body, validators
+
+def _domain_in(url: str, domains) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+async def _timed(stage: str, coro):
+    """只统计跑完的那一路，被取消的一路不计入阶段耗时"""
+    t0 = time.perf_counter()
+    res = await coro
+    STAGE_SECONDS.observe(time.perf_counter() - t0, stage=stage)
+    return res
+
+async def fetch_hedged(url: str, force: bool = False, on_start=None) -> tuple[dict | None, str]:
+    """
+    对冲抓取：先跑本地抓取，超过 CRAWL_HEDGE_DELAY 还没拿到结果 (或本地已失败) 就启动 Jina，
+    两路谁先返回可用正文用谁，另一路取消。返回 (结果, "local"/"jina")，都失败返回 (None, "")。
+    on_start(step) 在每一路启动时回调，用于写进度事件。
+    """
+    tasks: dict[asyncio.Task, str] = {}
+
+    def start(step: str, coro):
+        if on_start:
+            on_start(step)
+        tasks[asyncio.create_task(_timed(step, coro))] = step
+
+    if _domain_in(url, CRAWL_JINA_ONLY_DOMAINS):
+        start("crawl_jina", fetch_via_jina(url, force=force))
+    else:
+        start("crawl_local", fetch_via_trafilatura(url, force=force))
+        if CRAWL_HEDGE_DELAY is None:
+            delay = None   # 关闭对冲：等本地跑完再决定要不要兜底
+        else:
+            delay = 0 if _domain_in(url, CRAWL_HEDGE_PARALLEL_DOMAINS) else CRAWL_HEDGE_DELAY
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done or not next(iter(done)).result():
+            start("crawl_jina", fetch_via_jina(url, force=force))
+
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # 同时完成时优先用本地结果 (带作者/站点等元数据)
+            for task in sorted(done, key=lambda t: tasks[t] != "crawl_local"):
+                res = task.result()
+                if res:
+                    winner = "local" if tasks[task] == "crawl_local" else "jina"
+                    CRAWL_HEDGE_RESULTS.inc(winner=winner, hedged=str(len(tasks) > 1).lower())
+                    return res, winner
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    CRAWL_HEDGE_RESULTS.inc(winner="none", hedged=str(len(tasks) > 1).lower())
+    return None, ""
@@ -0,0 +1,97 @@
+# 订阅源轮询：条件 GET -> 解析 -> 只把新条目作为批量任务入队，复用 process_content_to_obsidian 流水线
+import uuid
+from config import FEED_MAX_NEW_PER_POLL, FEED_SITEMAP_MAX_CHILDREN
+from core.crawler import fetch_feed
+from utils import feed_store, job_queue
+from utils.executors import run_blocking
+from utils.feed_parse import parse_feed
+from utils.helpers import url_hash
+from utils.logger import now_iso
+
+
+def _newest_first(entries: list[dict]) -> list[dict]:
+    """有日期的按日期倒序，没日期的保持源里的顺序排在后面"""
+    dated = sorted((e for e in entries if e["published"]), key=lambda e: e["published"], reverse=True)
+    return dated + [e for e in entries if not e["published"]]
+
+
+async def _expand_sitemap_index(feed: dict, children: list[dict]) -> list[dict]:
+    """站点地图索引：只展开高水位之后更新过的子地图 (没有 lastmod 的每轮都看)，数量有上限"""
+    hw = feed.get("high_water")
+    fresh = [c for c in _newest_first(children) if not hw or not c["published"] or c["published"] > hw]
+    entries = []
+    for child in fresh[:FEED_SITEMAP_MAX_CHILDREN]:
+        status, body, _ = await fetch_feed(child["link"])
+        if status != 200:
+            print(f"⚠️ 子站点地图拉取失败 {child['link']}: HTTP {status}")
+            continue
+        parsed = await run_blocking("cpu", parse_feed, body)
+        entries.extend(parsed["entries"])
+    return entries
+
+
+async def poll_feed(feed: dict, admission_error=None) -> int:
+    """
+    拉取一个订阅并把新条目入队，返回入队条数。
+    admission_error(user_id, count, lane) 返回非 None 时说明排队已满，这轮不推进高水位，稍后重试。
+    """
+    try:
+        status, body, validators = await fetch_feed(feed["url"], feed.get("etag"), feed.get("last_modified"))
+        if status == 304:
+            await run_blocking("io", feed_store.mark_polled, feed, kind=None, seen=[], validators=None, new_count=0)
+            return 0
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}")
+        parsed = await run_blocking("cpu", parse_feed, body)
+        entries = parsed["entries"]
+        if parsed["kind"] == "sitemapindex":
+            entries = await _expand_sitemap_index(feed, entries)
+    except Exception as e:
+        print(f"❌ 订阅拉取失败 {feed['url']}: {e}")
+        await run_blocking("io", feed_store.mark_failed, feed, str(e))
+        return 0
+
+    fresh = _newest_first(await run_blocking("io", feed_store.unseen_entries, feed, entries))
+    if not feed.get("initialized"):
+        # 新订阅：只回填最近几条，其余标记为已读，避免把整个源的历史灌进队列
+        to_enqueue, seen = fresh[:feed["backfill"]], fresh
+    else:
+        # 一次太多就先入队最老的一批，剩下的不标记已读，下轮接着取
+        to_enqueue = list(reversed(fresh))[:FEED_MAX_NEW_PER_POLL]
+        seen = to_enqueue
+        if len(fresh) > len(to_enqueue):
+            validators = {}   # 还有剩余：不保存条件请求头，否则下轮 304 就取不到了
+
+    if to_enqueue and admission_error:
+        rejected = admission_error(feed["user_id"], len(to_enqueue), lane="bulk")
+        if rejected:
+            reason, retry_after = rejected
+            print(f"⏳ 订阅 {feed['url']} 暂缓入队: {reason}")
+            await run_blocking("io", feed_store.mark_failed, feed, reason, max(retry_after / 60, 1))
+            return 0
+
+    received_at = now_iso()
+    batch_id = f"feed-{feed['feed_id']}-{uuid.uuid4().hex[:8]}"
+    jobs = [
+        {
+            "job_id": str(uuid.uuid4()),
+            "user_id": feed["user_id"],
+            "content": entry["link"],
+            "received_at": received_at,
+            "source": "feed",
+            "process_mode": "crawl",
+            "folder": feed.get("folder"),
+            "batch_id": batch_id,
+            "dedupe_key": url_hash(entry["link"]),
+        }
+        for entry in to_enqueue
+    ]
+    accepted = []
+    if jobs:
+        accepted, _ = await run_blocking("io", job_queue.enqueue_many, jobs)
+    # 高水位只用已入队/已标记的条目推进，没轮到的留给下一轮
+    await run_blocking("io", feed_store.mark_polled, feed, kind=parsed["kind"], seen=seen,
+                       validators=validators, new_count=len(accepted))
+    if accepted:
+        print(f"📰 订阅 {feed['url']} 新增 {len(accepted)} 条")
+    return len(accepted)
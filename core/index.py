@@ -1,4 +1,5 @@
 # core/index.py
+import time
 import sqlite3
 import jieba # 需要 pip install jieba 做中文分词
 from config import SQLITE_DB_PATH
@@ -24,6 +25,18 @@ def init_db():
         CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts_v2 
         USING fts5(doc_id, title, content, content_jieba, created_at, category, tags, user_id)
     ''')
+    # 已入库文档登记表：抓取前按 doc_id 查重
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            doc_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            url TEXT,
+            content_hash TEXT,
+            file_path TEXT,
+            indexed_at REAL NOT NULL,
+            PRIMARY KEY (doc_id, user_id)
+        )
+    ''')
     conn.commit()
     conn.close()
 
@@ -61,6 +74,49 @@ def save_to_keyword_index(raw_data: dict, ai_data: dict):
     conn.close()
     print(f"📇 关键词索引已更新: {doc_id[:6]}")
 
+def register_document(doc_id: str, user_id: str, url: str, content_hash: str, file_path: str):
+    conn = sqlite3.connect(SQLITE_DB_PATH)
+    conn.execute(
+        "INSERT OR REPLACE INTO documents (doc_id, user_id, url, content_hash, file_path, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (doc_id, user_id, url, content_hash, file_path, time.time()),
+    )
+    conn.commit()
+    conn.close()
+
+def get_document(doc_id: str, user_id: str) -> dict | None:
+    conn = sqlite3.connect(SQLITE_DB_PATH)
+    row = conn.execute(
+        "SELECT url, content_hash, file_path, indexed_at FROM documents WHERE doc_id = ? AND user_id = ?",
+        (doc_id, user_id),
+    ).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {"doc_id": doc_id, "url": row[0], "content_hash": row[1], "file_path": row[2], "indexed_at": row[3]}
+
+def unregistered_documents() -> list[tuple[str, str, str]]:
+    """FTS 里有、documents 登记表里没有的 (doc_id, user_id, content)：登记表上线前入库的老文章"""
+    conn = sqlite3.connect(SQLITE_DB_PATH)
+    if not _table_exists(conn, TABLE_V2):
+        conn.close()
+        return []
+    rows = conn.execute(f'''
+        SELECT doc_id, user_id, content FROM {TABLE_V2} AS f
+        WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.doc_id = f.doc_id AND d.user_id = f.user_id)
+    ''').fetchall()
+    conn.close()
+    return rows
+
+def register_documents(rows: list[tuple]):
+    """批量补登记 (doc_id, user_id, url, content_hash, file_path, indexed_at)，已有的不覆盖"""
+    conn = sqlite3.connect(SQLITE_DB_PATH)
+    conn.executemany(
+        "INSERT OR IGNORE INTO documents (doc_id, user_id, url, content_hash, file_path, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
 def search_keywords(query: str, top_k=10, user_id: str | None = None):
     """BM25 关键词检索"""
     conn = sqlite3.connect(SQLITE_DB_PATH)
@@ -1,7 +1,273 @@
+import asyncio
+import heapq
+import itertools
 import json
-import httpx
 import time
-from config import LLM_API_URL, LLM_MODEL
+from config import (
+    LLM_API_URL,
+    LLM_MODEL,
+    LLM_GATEWAY_CONCURRENCY,
+    LLM_GATEWAY_BACKGROUND_SLOTS,
+    LLM_PRIORITIES,
+)
+from utils.http_client import get_async_client, close_clients
+from utils.metrics import (
+    LLM_SECONDS, LLM_TOKENS, LLM_TOKENS_PER_SECOND,
+    LLM_QUEUE_SECONDS, LLM_INFLIGHT, LLM_REQUESTS, LLM_FIRST_TOKEN_SECONDS,
+)
+
+def record_llm_usage(caller: str, data: dict, seconds: float):
+    """按 OpenAI 兼容返回里的 usage 记录耗时和 token 吞吐"""
+    LLM_SECONDS.observe(seconds, caller=caller)
+    usage = data.get("usage") or {}
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    LLM_TOKENS.inc(prompt_tokens, caller=caller, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, caller=caller, kind="completion")
+    if completion_tokens and seconds > 0:
+        LLM_TOKENS_PER_SECOND.observe(completion_tokens / seconds, caller=caller)
+
+
+class _PriorityGate:
+    """
+    带优先级的并发闸门：空出的槽位先给数字小的优先级 (interactive=0)；
+    后台优先级 (>0) 最多同时占 background_slots 个槽，剩下的留给交互请求。
+    已经发出去的请求不会被打断，"抢占" 发生在排队这一步。
+    """
+
+    def __init__(self, capacity: int, background_slots: int):
+        self.capacity = max(1, capacity)
+        self.background_slots = max(1, min(background_slots, self.capacity))
+        self.active = 0
+        self.active_background = 0
+        self._waiters = []   # heap: (priority, seq, future)
+        self._seq = itertools.count()
+
+    def _can_run(self, priority: int) -> bool:
+        if self.active >= self.capacity:
+            return False
+        return priority == 0 or self.active_background < self.background_slots
+
+    def _take(self, priority: int):
+        self.active += 1
+        if priority:
+            self.active_background += 1
+
+    async def acquire(self, priority: int):
+        ahead = any(p <= priority and not fut.done() for p, _, fut in self._waiters)
+        if not ahead and self._can_run(priority):
+            self._take(priority)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # 已经分到槽位但调用方被取消：把槽位还回去
+            if fut.done() and not fut.cancelled():
+                self.release(priority)
+            raise
+
+    def release(self, priority: int):
+        self.active -= 1
+        if priority:
+            self.active_background -= 1
+        self._wake()
+
+    def _wake(self):
+        blocked = []
+        while self._waiters and self.active < self.capacity:
+            item = heapq.heappop(self._waiters)
+            priority, _, fut = item
+            if fut.done():
+                continue
+            if self._can_run(priority):
+                self._take(priority)
+                fut.set_result(None)
+            else:
+                blocked.append(item)
+        for item in blocked:
+            heapq.heappush(self._waiters, item)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "active": self.active,
+            "active_background": self.active_background,
+            "waiting": sum(1 for _, _, fut in self._waiters if not fut.done()),
+        }
+
+
+_gate = _PriorityGate(LLM_GATEWAY_CONCURRENCY, LLM_GATEWAY_BACKGROUND_SLOTS)
+_loop = None
+
+
+def bind_loop():
+    """在主事件循环里调用一次，之后线程池里的 complete_sync 会投递到这个循环排队"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+
+
+def gateway_stats() -> dict:
+    return _gate.stats()
+
+
+def message_text(data: dict) -> str:
+    return data["choices"][0]["message"]["content"]
+
+
+async def complete(
+    messages: list,
+    *,
+    caller: str,
+    priority: str = "ingest",
+    temperature: float = 0.7,
+    max_tokens: int = None,
+    timeout: float = None,
+    model: str = LLM_MODEL,
+    url: str = LLM_API_URL,
+) -> dict:
+    """
+    所有 LLM/VLM 请求的统一入口：按优先级排队拿槽位，再走共享的 llm 客户端。
+    调用方被取消 (客户端断开、任务超时) 时，排队中的直接出队，在途的请求连接一并关闭。
+    """
+    level = LLM_PRIORITIES[priority]
+    payload = {"model": model, "messages": messages, "temperature": temperature, "stream": False}
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    kwargs = {"json": payload}
+    if timeout:
+        kwargs["timeout"] = timeout
+
+    t_wait = time.perf_counter()
+    try:
+        await _gate.acquire(level)
+    except asyncio.CancelledError:
+        LLM_REQUESTS.inc(caller=caller, result="cancelled")
+        raise
+    LLM_QUEUE_SECONDS.observe(time.perf_counter() - t_wait, caller=caller, priority=priority)
+    LLM_INFLIGHT.inc(priority=priority)
+    t0 = time.perf_counter()
+    try:
+        resp = await get_async_client("llm").post(url, **kwargs)
+        resp.raise_for_status()
+        data = resp.json()
+    except asyncio.CancelledError:
+        LLM_REQUESTS.inc(caller=caller, result="cancelled")
+        raise
+    except Exception:
+        LLM_REQUESTS.inc(caller=caller, result="error")
+        raise
+    finally:
+        _gate.release(level)
+        LLM_INFLIGHT.dec(priority=priority)
+    record_llm_usage(caller, data, time.perf_counter() - t0)
+    LLM_REQUESTS.inc(caller=caller, result="ok")
+    return data
+
+
+async def stream_complete(
+    messages: list,
+    *,
+    caller: str,
+    priority: str = "interactive",
+    temperature: float = 0.7,
+    max_tokens: int = None,
+    timeout: float = None,
+    model: str = LLM_MODEL,
+    url: str = LLM_API_URL,
+):
+    """
+    流式版 complete()：同样按优先级排队，之后逐段 yield 模型吐出的文本增量 (OpenAI 兼容 SSE)。
+    消费方提前停止 (aclose / 取消) 时关闭上游连接并归还槽位。
+    """
+    level = LLM_PRIORITIES[priority]
+    payload = {
+        "model": model, "messages": messages, "temperature": temperature,
+        "stream": True, "stream_options": {"include_usage": True},
+    }
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    kwargs = {"json": payload}
+    if timeout:
+        kwargs["timeout"] = timeout
+
+    t_wait = time.perf_counter()
+    try:
+        await _gate.acquire(level)
+    except asyncio.CancelledError:
+        LLM_REQUESTS.inc(caller=caller, result="cancelled")
+        raise
+    LLM_QUEUE_SECONDS.observe(time.perf_counter() - t_wait, caller=caller, priority=priority)
+    LLM_INFLIGHT.inc(priority=priority)
+    t0 = time.perf_counter()
+    usage = {}
+    first = True
+    result = "ok"
+    try:
+        async with get_async_client("llm").stream("POST", url, **kwargs) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == "[DONE]":
+                    break
+                try:
+                    data = json.loads(chunk)
+                except ValueError:
+                    continue
+                usage = data.get("usage") or usage
+                for choice in data.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if not text:
+                        continue
+                    if first:
+                        # 从进入队列开始算，用户感受到的就是这个等待
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - t_wait, caller=caller)
+                        first = False
+                    yield text
+    except (asyncio.CancelledError, GeneratorExit):
+        result = "cancelled"
+        raise
+    except Exception:
+        result = "error"
+        raise
+    finally:
+        _gate.release(level)
+        LLM_INFLIGHT.dec(priority=priority)
+        LLM_REQUESTS.inc(caller=caller, result=result)
+    record_llm_usage(caller, {"usage": usage}, time.perf_counter() - t0)
+
+
+def complete_sync(messages: list, **kwargs) -> dict:
+    """
+    给线程池里的同步代码用 (日报、VLM)：有主事件循环就投递过去和其他请求一起排队；
+    脚本里没有事件循环时直接 asyncio.run。
+    """
+    loop = _loop
+    if loop is not None and loop.is_running():
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("complete_sync 不能在事件循环线程里调用，请 await complete()")
+        future = asyncio.run_coroutine_threadsafe(complete(messages, **kwargs), loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+    return asyncio.run(_complete_and_close(messages, **kwargs))
+
+
+async def _complete_and_close(messages: list, **kwargs) -> dict:
+    """临时事件循环里跑一次 complete，结束前关掉这个循环上的客户端，避免连接池泄漏"""
+    try:
+        return await complete(messages, **kwargs)
+    finally:
+        await close_clients()
 
 async def call_llm_analysis(content: str, category: str):
     print(f"🧠 AI 分析中... [{category}]")
@@ -13,62 +279,44 @@ async def call_llm_analysis(content: str, category: str):
 
     system_prompt = f"你是一个资深知识库管理员。请根据内容类型：{category}，严格以JSON格式返回结果。\n{instruction}\n不要包含Markdown标记。"
 
-    payload = {
-        "model": LLM_MODEL,
-        "temperature": 0.1,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"内容：\n{content[:25000]}"}
-        ]
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"内容：\n{content[:25000]}"}
+    ]
 
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            resp = await client.post(LLM_API_URL, json=payload)
-            resp.raise_for_status()
-            raw = resp.json()['choices'][0]['message']['content']
-            clean = raw.replace("```json", "").replace("```", "").strip()
-            return json.loads(clean)
+        data = await complete(messages, caller="analysis", priority="ingest", temperature=0.1)
+        raw = message_text(data)
+        clean = raw.replace("```json", "").replace("```", "").strip()
+        return json.loads(clean)
     except Exception as e:
         print(f"❌ LLM 失败: {e}")
         raise
     
-def chat(user_query: str, system_prompt: str = "你是一个有用的助手。") -> str:
+async def achat(
+    user_query: str,
+    system_prompt: str = "你是一个有用的助手。",
+    caller: str = "chat",
+    priority: str = "interactive",
+    temperature: float = 0.7,
+) -> str:
     """
-    通用对话函数，供 Web UI (RAG) 使用
+    通用对话函数 (异步)，/api/chat 用；默认 interactive 优先级，排在后台分析前面
     """
     print(f"🤖 LLM 正在思考: {user_query[:20]}...")
-    
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "model": LLM_MODEL, # 确保你的 config 里有 MODEL_NAME，没有的话写死字符串也可以
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_query}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 2000,
-        "stream": False
-    }
-
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_query}
+    ]
     try:
-        # 使用 httpx 发送请求 (复用之前的 LLM_API_URL)
-        response = httpx.post(
-            LLM_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=60.0 # RAG 检索阅读量大，超时设长一点
+        data = await complete(
+            messages, caller=caller, priority=priority,
+            temperature=temperature, max_tokens=2000,
+            timeout=60.0,  # RAG 检索阅读量大，超时设长一点
         )
-        response.raise_for_status()
-        
-        # 解析返回结果
-        result = response.json()
-        answer = result['choices'][0]['message']['content']
-        return answer
-
+        return message_text(data)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"❌ Chat 接口调用失败: {e}")
         return f"抱歉，我的大脑（LLM）暂时连接不上。错误信息：{e}"
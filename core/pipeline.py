@@ -1,19 +1,90 @@
-import re
 import time
 import os
+import asyncio
 import hashlib
+from config import (
+    CRAWL_CONCURRENCY, LLM_CONCURRENCY, EMBED_CONCURRENCY,
+    INGEST_FRESHNESS_POLICY, INGEST_FRESHNESS_TTL_DAYS,
+)
 from utils.logger import append_job_event
-from utils.helpers import url_hash
-from core.crawler import fetch_via_trafilatura, fetch_via_jina
+from utils.job_queue import save_checkpoint, load_checkpoint
+from utils.helpers import url_hash, find_urls
+from utils.executors import run_blocking
+from utils.metrics import STAGE_SECONDS
+from core.crawler import fetch_hedged
 from core.llm import call_llm_analysis
 from core.storage import save_to_obsidian, save_to_vector_db, resolve_user_root
 from core.wechat import send_wecom_msg
-from core.index import save_to_keyword_index
+from core.index import save_to_keyword_index, register_document, get_document
 
-async def process_content_to_obsidian(job_id: str, content: str, user_id: str, mode: str = "auto", folder: str | None = None):
-    t0 = time.time()
-    append_job_event(job_id, "RUNNING", step="start", user_id=user_id)
-    
+# 分阶段限流：抓取 / LLM / 落盘向量化各自独立，
+# 这样 Job N 在等 LLM 时，Job N+1 可以先去抓取
+STAGE_LIMITS = {
+    "crawl": asyncio.Semaphore(CRAWL_CONCURRENCY),
+    "llm": asyncio.Semaphore(LLM_CONCURRENCY),
+    "embed": asyncio.Semaphore(EMBED_CONCURRENCY),
+}
+
+def _save_all(payload: dict, ai_res: dict, user_id: str, job_id: str):
+    """同步落盘：文件 + 关键词索引 + 向量库 (在线程里跑，避免阻塞事件循环)"""
+    # A. 存文件 (Truth)
+    user_root = resolve_user_root(user_id)
+    with STAGE_SECONDS.time(stage="markdown_write"):
+        path, doc_id = save_to_obsidian(payload, ai_res, user_root, payload.get("folder"))
+    with STAGE_SECONDS.time(stage="fts_write"):
+        save_to_keyword_index(payload, ai_res)
+
+    # B. 存向量 (Brain)
+    append_job_event(job_id, "RUNNING", step="save_vector_start", message="开始向量化...")
+
+    chunk_count = save_to_vector_db(payload, ai_res, path, doc_id)
+    # 向量写成功后才登记：否则失败进死信的文档会被查重当成“已收录”，再分享也补不上向量
+    register_document(doc_id, user_id, payload.get("url", ""), payload.get("content_hash", ""), path)
+
+    append_job_event(job_id, "RUNNING", step="save_vector_success",
+                     message=f"向量化完成，切分 {chunk_count} 块",
+                     extra={"chunk_count": chunk_count, "doc_id": doc_id})
+    return path
+
+class StageError(Exception):
+    """某个阶段失败，由 worker 决定重试还是进死信"""
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+class AlreadyIndexed(Exception):
+    """文档已收录且按当前策略无需重做"""
+    def __init__(self, doc: dict, reason: str):
+        super().__init__(reason)
+        self.doc = doc
+
+def content_hash(text: str) -> str:
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+def _indexed_doc(doc_id: str, user_id: str) -> dict | None:
+    """已登记且文件还在的文档才算收录过"""
+    doc = get_document(doc_id, user_id)
+    if doc and doc.get("file_path") and os.path.exists(doc["file_path"]):
+        return doc
+    return None
+
+def _check_before_crawl(doc_id: str, user_id: str, policy: str):
+    """抓取前查重：skip 策略且未过期 -> 直接跳过"""
+    if policy != "skip":
+        return
+    doc = _indexed_doc(doc_id, user_id)
+    if doc and time.time() - doc["indexed_at"] < INGEST_FRESHNESS_TTL_DAYS * 86400:
+        raise AlreadyIndexed(doc, "已收录")
+
+def _check_after_crawl(doc_id: str, user_id: str, policy: str, new_hash: str):
+    """抓取后查重：正文 hash 没变就不用再跑 AI 和向量化"""
+    if policy == "force":
+        return
+    doc = _indexed_doc(doc_id, user_id)
+    if doc and doc.get("content_hash") == new_hash:
+        raise AlreadyIndexed(doc, "内容未变化")
+
+async def _crawl_stage(job_id: str, content: str, user_id: str, mode: str, folder: str | None, policy: str) -> dict:
     # === ✨ 修复点 1: 自动补全协议头 ===
     # 只有当用户明确指定 mode="crawl" 时才触发，防止误伤普通笔记
     if mode == "crawl" and not content.startswith(("http://", "https://")):
@@ -22,45 +93,41 @@ async def process_content_to_obsidian(job_id: str, content: str, user_id: str, m
             print(f"🔧 [Job {job_id}] 检测到缺少协议头，自动补全 https://")
             content = f"https://{content}"
 
-    url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[^\s]*'
-    
     # === ✨ 修复点 2: 逻辑判断 ===
     if mode == "note":
         urls = [] # 强制清空 URL，不走爬虫分支
         print(f"📝 Job {job_id}: 用户指定为纯笔记模式，强制跳过 URL 解析")
     else:
         # 默认模式 ("auto" 或 "crawl") 才去解析 URL
-        urls = re.findall(url_pattern, content)
+        urls = find_urls(content)
         
     payload = {}
     target_url = ""
 
-    # === 1. 抓取阶段 ===
     if urls:
         target_url = urls[0]
-        use_jina = "xiaohongshu.com" in target_url or "xhslink.com" in target_url
-        
-        if not use_jina:
-            append_job_event(job_id, "RUNNING", step="crawl_local", url=target_url)
-            res = await fetch_via_trafilatura(target_url)
-            if res: payload = res
-            else: use_jina = True
-            
-        if use_jina:
-            append_job_event(job_id, "RUNNING", step="crawl_jina", url=target_url)
-            res = await fetch_via_jina(target_url)
-            if res: 
-                payload = res
+        doc_id = url_hash(target_url)
+        _check_before_crawl(doc_id, user_id, policy)
+        async with STAGE_LIMITS["crawl"]:
+            def on_start(step: str):
+                append_job_event(job_id, "RUNNING", step=step, url=target_url)
+
+            with STAGE_SECONDS.time(stage="crawl"):
+                res, winner = await fetch_hedged(target_url, force=policy == "force", on_start=on_start)
+            if not res:
+                # 错误熔断
+                raise StageError("crawl", "抓取失败")
+            payload = res
+            if winner == "jina":
                 payload["category"] = "文章阅读"
-            else:
-                payload = {"type": "error", "msg": "抓取失败", "url": target_url}
         
-        if payload.get("type") != "error":
-            payload["doc_id"] = url_hash(target_url)
-            payload["created_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-            payload["user_id"] = user_id
-            if folder:
-                payload["folder"] = folder
+        payload["doc_id"] = doc_id
+        payload["content_hash"] = content_hash(payload.get("content", ""))
+        _check_after_crawl(doc_id, user_id, policy, payload["content_hash"])
+        payload["created_at"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+        payload["user_id"] = user_id
+        if folder:
+            payload["folder"] = folder
             
     else:
         # 个人笔记 (当 mode="note" 时，或者 mode="crawl" 但真的没输链接时走进这里)
@@ -70,55 +137,74 @@ async def process_content_to_obsidian(job_id: str, content: str, user_id: str, m
             "content": content,
             "title": f"随手记_{content[:10].replace(chr(10), ' ')}",
             "doc_id": hashlib.md5(content.encode()).hexdigest(),
+            "content_hash": content_hash(content),
             "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
             "user_id": user_id
         }
         if folder:
             payload["folder"] = folder
+        # 笔记的 doc_id 就是内容 hash，重复发送同一条笔记直接跳过
+        _check_after_crawl(payload["doc_id"], user_id, policy, payload["content_hash"])
 
-    # 错误熔断
-    if payload.get("type") == "error":
-        append_job_event(job_id, "FAILED", step="crawl", error=payload.get("msg"))
-        await send_wecom_msg(user_id, f"❌ 入库失败: {payload.get('msg')}")
-        return
+    return payload
 
-    # === 2. AI 分析 ===
-    try:
-        # 如果是笔记，也可以让 AI 帮忙打标签或润色，这里保持原样调用
-        ai_res = await call_llm_analysis(payload["content"], payload["category"])
-    except Exception as e:
-        await send_wecom_msg(user_id, f"⚠️ AI 失败: {e}")
-        append_job_event(job_id, "FAILED", step="ai", error=str(e))
-        return
+async def process_content_to_obsidian(job_id: str, content: str, user_id: str, mode: str = "auto",
+                                     folder: str | None = None, freshness: str | None = None):
+    """
+    抓取 -> AI 分析 -> 保存 -> 通知。
+    抓取结果和 AI 结果都会写检查点，失败重试时从失败的阶段继续；
+    失败时抛 StageError，由 worker 负责重试 / 死信 / 通知用户。
+    freshness 覆盖 INGEST_FRESHNESS_POLICY (skip / if_changed / force)。
+    """
+    t0 = time.time()
+    append_job_event(job_id, "RUNNING", step="start", user_id=user_id)
+    policy = freshness or INGEST_FRESHNESS_POLICY
+
+    # === 1. 抓取阶段 (有检查点则跳过) ===
+    payload = load_checkpoint(job_id, "crawl")
+    if payload:
+        append_job_event(job_id, "RUNNING", step="resume_crawl", message="复用已抓取内容")
+    else:
+        try:
+            payload = await _crawl_stage(job_id, content, user_id, mode, folder, policy)
+        except AlreadyIndexed as e:
+            file_name = os.path.basename(e.doc["file_path"])
+            ok = await send_wecom_msg(user_id, f"♻️ **已在知识库中** ({e})\n📄 {file_name}")
+            status = "SUCCESS" if ok else "SUCCESS_NOTIFY_FAIL"
+            append_job_event(job_id, status, step="done", message=f"{e}，跳过重复处理",
+                             extra={"doc_id": e.doc["doc_id"], "skipped": True})
+            return
+        save_checkpoint(job_id, "crawl", payload)
 
-    # === 3. 保存 (双写模式) ===
+    # === 2. AI 分析 (有检查点则跳过) ===
+    ai_res = load_checkpoint(job_id, "ai")
+    if ai_res:
+        append_job_event(job_id, "RUNNING", step="resume_ai", message="复用已有 AI 分析")
+    else:
+        try:
+            # 如果是笔记，也可以让 AI 帮忙打标签或润色，这里保持原样调用
+            async with STAGE_LIMITS["llm"]:
+                with STAGE_SECONDS.time(stage="llm_analysis"):
+                    ai_res = await call_llm_analysis(payload["content"], payload["category"])
+        except Exception as e:
+            raise StageError("ai", f"AI 失败: {e}") from e
+        save_checkpoint(job_id, "ai", ai_res)
+
+    # === 3. 保存 (双写模式，本身幂等，失败直接整段重做) ===
     try:
-        # A. 存文件 (Truth)
-        user_root = resolve_user_root(user_id)
-        path, doc_id = save_to_obsidian(payload, ai_res, user_root, payload.get("folder"))
-        save_to_keyword_index(payload, ai_res)
-        
-        # B. 存向量 (Brain)
-        append_job_event(job_id, "RUNNING", step="save_vector_start", message="开始向量化...")
-        
-        chunk_count = save_to_vector_db(payload, ai_res, path, doc_id)
-        
-        append_job_event(job_id, "RUNNING", step="save_vector_success", 
-                         message=f"向量化完成，切分 {chunk_count} 块",
-                         extra={"chunk_count": chunk_count, "doc_id": doc_id})
-        
+        async with STAGE_LIMITS["embed"]:
+            path = await run_blocking("io", _save_all, payload, ai_res, user_id, job_id)
     except Exception as e:
-        await send_wecom_msg(user_id, f"⚠️ 保存失败: {e}")
-        append_job_event(job_id, "FAILED", step="save_error", error=str(e))
         print(f"❌ 保存流程异常: {e}")
-        return
+        raise StageError("save_error", f"保存失败: {e}") from e
 
     # === 4. 通知 ===
     try:
         file_name = os.path.basename(path)
         duration = round(time.time() - t0, 2)
         
-        ok = await send_wecom_msg(user_id, f"✅ **入库成功**\n📄 {file_name}")
+        with STAGE_SECONDS.time(stage="notify"):
+            ok = await send_wecom_msg(user_id, f"✅ **入库成功**\n📄 {file_name}")
         status = "SUCCESS" if ok else "SUCCESS_NOTIFY_FAIL"
         
         append_job_event(job_id, status, step="done", message=f"耗时 {duration}s")
@@ -1,19 +1,23 @@
 # core/retriever.py
 from core.storage import collection as chroma_collection
+import time
 from core.index import search_keywords
+from utils.metrics import RETRIEVAL_SECONDS
 
 def hybrid_search(query: str, top_k=5, user_id: str | None = None):
     """
     混合检索：向量(语义) + 关键词(精确) -> RRF合并
     """
     print(f"🔍 正在进行混合检索: {query}")
+    t0 = time.perf_counter()
     
     # 1. 向量检索 (找意思相近的)
-    vec_res = chroma_collection.query(
-        query_texts=[query],
-        n_results=top_k*2,
-        include=["documents", "metadatas", "distances"],
-    )
+    with RETRIEVAL_SECONDS.time(part="vector"):
+        vec_res = chroma_collection.query(
+            query_texts=[query],
+            n_results=top_k*2,
+            include=["documents", "metadatas", "distances"],
+        )
     vec_docs = []
     if vec_res['ids']:
         for i, doc_id in enumerate(vec_res['ids'][0]):
@@ -27,7 +31,8 @@ def hybrid_search(query: str, top_k=5, user_id: str | None = None):
             })
             
     # 2. 关键词检索 (找字面匹配的)
-    kw_res = search_keywords(query, top_k=top_k*2, user_id=user_id)
+    with RETRIEVAL_SECONDS.time(part="keyword"):
+        kw_res = search_keywords(query, top_k=top_k*2, user_id=user_id)
     kw_docs = []
     for i, item in enumerate(kw_res):
         kw_docs.append({
@@ -64,4 +69,5 @@ def hybrid_search(query: str, top_k=5, user_id: str | None = None):
             "score": score
         })
         
+    RETRIEVAL_SECONDS.observe(time.perf_counter() - t0, part="total")
     return final_results
@@ -9,6 +9,8 @@ from config import (
     CHROMA_COLLECTION_NAME, MIN_CONTENT_LENGTH, CHUNK_SIZE, CHUNK_OVERLAP
 )
 from utils.helpers import sanitize_filename, url_hash
+from utils.metrics import STAGE_SECONDS
+from core.index import unregistered_documents, register_documents
 
 # === 1. 初始化向量数据库 ===
 print("🧠 正在初始化 ChromaDB...")
@@ -190,7 +192,8 @@ def save_to_vector_db(raw_data: dict, ai_data: dict, file_path: str, doc_id: str
         pass # 如果不存在也没关系
 
     # 2. 文本分块
-    chunks = split_text_into_chunks(content)
+    with STAGE_SECONDS.time(stage="chunking"):
+        chunks = split_text_into_chunks(content)
     if not chunks:
         return 0
 
@@ -223,11 +226,46 @@ def save_to_vector_db(raw_data: dict, ai_data: dict, file_path: str, doc_id: str
 
     # 4. 批量写入 Chroma
     # 这里的 documents 会被自动 Embedding
-    collection.upsert(
-        ids=ids,
-        documents=documents,
-        metadatas=metadatas
-    )
+    with STAGE_SECONDS.time(stage="embedding"):
+        collection.upsert(
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas
+        )
     
     print(f"🧠 向量化完成: {title} -> 切分 {len(chunks)} 块")
     return len(chunks)
+
+
+# === 5. 老文档补登记 ===
+def backfill_document_registry(batch_size: int = 200) -> int:
+    """
+    documents 登记表上线前入库的文章只在 FTS / Chroma / Markdown 里，抓取前查重会漏掉。
+    按 FTS 的 (doc_id, user_id) + Chroma 里的 file_path/source 补登记，入库时间取文件修改时间。
+    找不到 Markdown 文件的跳过 (查重本来也要求文件存在)。
+    """
+    rows = unregistered_documents()
+    registered = []
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        res = collection.get(where={"parent_id": {"$in": [r[0] for r in batch]}}, include=["metadatas"])
+        located = {}
+        for meta in res.get("metadatas") or []:
+            if meta and meta.get("file_path"):
+                located.setdefault((meta.get("parent_id"), meta.get("user_id") or ""), meta)
+        for doc_id, user_id, content in batch:
+            # 早期的向量没写 user_id，按空用户兜底
+            meta = located.get((doc_id, user_id)) or located.get((doc_id, ""))
+            if not meta:
+                continue
+            path = meta["file_path"]
+            if not os.path.exists(path):
+                continue
+            registered.append((
+                doc_id, user_id, meta.get("source", ""),
+                hashlib.md5((content or "").encode("utf-8")).hexdigest(),
+                path, os.path.getmtime(path),
+            ))
+    if registered:
+        register_documents(registered)
+    return len(registered)
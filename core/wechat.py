@@ -1,7 +1,7 @@
 import time
 import re
-import httpx
 from config import CORP_ID, CORP_SECRET, AGENT_ID
+from utils.http_client import get_async_client
 
 # 全局状态，Main 中也需要访问它
 SYSTEM_STATE = {"error": False, "msg": ""}
@@ -12,14 +12,13 @@ async def get_access_token():
         return token_cache["access_token"]
     
     url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={CORP_ID}&corpsecret={CORP_SECRET}"
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(url)
-        data = resp.json()
-        if data.get("errcode") == 0:
-            token_cache["access_token"] = data["access_token"]
-            token_cache["expires_at"] = time.time() + 7000 
-            return data["access_token"]
-        return None
+    resp = await get_async_client("wecom").get(url)
+    data = resp.json()
+    if data.get("errcode") == 0:
+        token_cache["access_token"] = data["access_token"]
+        token_cache["expires_at"] = time.time() + 7000 
+        return data["access_token"]
+    return None
 
 async def send_wecom_msg(user_id: str, content: str):
     global SYSTEM_STATE
@@ -36,21 +35,20 @@ async def send_wecom_msg(user_id: str, content: str):
     }
     
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.post(url, json=payload)
-            res_data = resp.json()
-            
-            if res_data.get("errcode") == 60020:
-                error_msg = res_data.get("errmsg", "")
-                ip_match = re.search(r"from ip: ([\d\.]+)", error_msg)
-                new_ip = ip_match.group(1) if ip_match else "未知"
-                SYSTEM_STATE["error"] = True
-                SYSTEM_STATE["msg"] = new_ip
-                print(f"⚠️ IP 变动: {new_ip}")
-                return False
-            elif res_data.get("errcode") == 0:
-                SYSTEM_STATE["error"] = False
-                return True
+        resp = await get_async_client("wecom").post(url, json=payload)
+        res_data = resp.json()
+        
+        if res_data.get("errcode") == 60020:
+            error_msg = res_data.get("errmsg", "")
+            ip_match = re.search(r"from ip: ([\d\.]+)", error_msg)
+            new_ip = ip_match.group(1) if ip_match else "未知"
+            SYSTEM_STATE["error"] = True
+            SYSTEM_STATE["msg"] = new_ip
+            print(f"⚠️ IP 变动: {new_ip}")
+            return False
+        elif res_data.get("errcode") == 0:
+            SYSTEM_STATE["error"] = False
+            return True
     except Exception as e:
         print(f"❌ 发送通知出错: {e}")
     return False
\ No newline at end of file
@@ -6,14 +6,17 @@ import os
 import re
 import time
 import shutil
+import hashlib
+import math
 import xmltodict
 import chromadb
 from fastapi import FastAPI, Request, BackgroundTasks, HTTPException, Header, UploadFile, File, Form
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from wechatpy.crypto import WeChatCrypto
 from wechatpy.replies import create_reply
 from wechatpy.exceptions import InvalidSignatureException
 from pydantic import BaseModel
+from typing import Literal
 
 # 引入配置
 from config import (
@@ -23,13 +26,40 @@ from config import (
     API_SECRET_KEY, 
     CHROMA_DB_PATH,    # ⚠️ 请确认 config.py 里是 CHROMA_PATH 还是 CHROMA_DB_PATH，这里要一致
     OBSIDIAN_ROOT,
-    SPECIAL_USER
+    SPECIAL_USER,
+    WORKER_CONCURRENCY,
+    QUEUE_VISIBILITY_TIMEOUT,
+    QUEUE_POLL_INTERVAL,
+    QUEUE_PRIORITY_INTERACTIVE,
+    QUEUE_INTERACTIVE_RESERVED_WORKERS,
+    BATCH_INGEST_MAX_ITEMS,
+    QUEUE_MAX_DEPTH_GLOBAL,
+    QUEUE_MAX_DEPTH_PER_USER,
+    QUEUE_MAX_DEPTH_PER_USER_BULK,
+    QUEUE_PRIORITY_BULK,
+    JOB_STREAM_MAX_SECONDS,
+    FEED_POLL_TICK,
+    FEED_DEFAULT_INTERVAL_MINUTES,
+    FEED_MIN_INTERVAL_MINUTES,
+    FEED_INITIAL_BACKFILL,
 )
 
 from core.wechat import SYSTEM_STATE, send_wecom_msg
-from core.pipeline import process_content_to_obsidian
-from utils.inbox import write_inbox_job, list_inbox_jobs, mark_inbox_done
-from utils.logger import append_job_event, now_iso, get_job_latest_status # 👈 引入新函数
+from core.feeds import poll_feed
+from core.pipeline import process_content_to_obsidian, StageError
+from utils import job_queue, job_log
+from utils.inbox import write_inbox_job, import_legacy_inbox
+from utils.helpers import find_urls, url_hash
+from utils.executors import run_blocking, pool_stats, warm_pools, shutdown_pools, PoolBusyError
+from utils.http_client import close_clients
+from utils.doc_convert import convert_to_markdown
+from utils import metrics
+from utils import crawl_cache
+from utils import feed_store
+from utils.logger import (
+    append_job_event, now_iso, get_job_latest_status, load_status_index, flush_job_log,
+    subscribe_job, unsubscribe_job,
+) # 👈 引入新函数
 from utils.auth import (
     init_auth_db,
     create_user,
@@ -47,12 +77,17 @@ from utils.voice import transcribe_audio
 from utils.image_ingest import analyze_image, build_image_filename, build_title, build_markdown
 from core.retriever import hybrid_search
 from core.llm import call_llm_analysis
-from core.llm import chat as llm_chat
-from core.storage import resolve_user_root, save_to_vector_db
+from core.llm import achat, complete, stream_complete, message_text, gateway_stats
+from core.llm import bind_loop as bind_llm_loop
+from core.storage import resolve_user_root, save_to_vector_db, backfill_document_registry
 from core.index import save_to_keyword_index
 
 app = FastAPI()
 
+@app.exception_handler(PoolBusyError)
+async def pool_busy_handler(request: Request, exc: PoolBusyError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "5"})
+
 # === 1. 初始化服务 ===
 crypto = WeChatCrypto(TOKEN, ENCODING_AES_KEY, CORP_ID)
 
@@ -171,6 +206,33 @@ class IngestPayload(BaseModel):
     content: str
     mode: str = "auto"
     folder: str | None = None
+    freshness: Literal["skip", "if_changed", "force"] | None = None
+
+class BatchIngestPayload(BaseModel):
+    items: list[str]
+    mode: str = "auto"
+    folder: str | None = None
+    freshness: Literal["skip", "if_changed", "force"] | None = None
+
+class FeedPayload(BaseModel):
+    url: str
+    folder: str | None = None
+    interval_minutes: int = FEED_DEFAULT_INTERVAL_MINUTES
+    backfill: int = FEED_INITIAL_BACKFILL
+
+class LLMChatPayload(BaseModel):
+    messages: list[dict]
+    temperature: float = 0.7
+    max_tokens: int | None = None
+    caller: Literal["ui_chat", "ui_intent"] = "ui_chat"
+
+def ingest_dedupe_key(content: str, mode: str) -> str:
+    """链接按规范化 URL 去重，纯文本按内容去重"""
+    if mode != "note":
+        urls = find_urls(content)
+        if urls:
+            return url_hash(urls[0])
+    return hashlib.md5(content.strip().encode("utf-8")).hexdigest()
 
 def require_user(authorization: str | None) -> str:
     if not authorization or not authorization.startswith("Bearer "):
@@ -181,6 +243,44 @@ def require_user(authorization: str | None) -> str:
         raise HTTPException(status_code=401, detail="Invalid token")
     return username
 
+def estimate_retry_after(backlog: int) -> int:
+    """按最近任务平均耗时估算多久后能腾出位置"""
+    avg = metrics.JOB_SECONDS.mean(result="success") or 30.0
+    seconds = math.ceil(max(backlog, 1) * avg / max(WORKER_CONCURRENCY, 1))
+    return min(max(seconds, 5), 3600)
+
+ADMISSION_LANES = {
+    "interactive": (QUEUE_PRIORITY_INTERACTIVE, QUEUE_MAX_DEPTH_PER_USER),
+    "bulk": (QUEUE_PRIORITY_BULK, QUEUE_MAX_DEPTH_PER_USER_BULK),
+}
+
+def admission_error(user_id: str, count: int = 1, lane: str = "interactive") -> tuple[str, int] | None:
+    """超过全局或单用户 (按通道分别计) 排队上限时返回 (原因, 建议重试秒数)"""
+    priority, per_user = ADMISSION_LANES[lane]
+    total, mine = job_queue.active_counts(user_id, priority)
+    if mine + count > per_user:
+        return f"你的排队任务已达上限 ({mine}/{per_user})", estimate_retry_after(mine + count - per_user)
+    if total + count > QUEUE_MAX_DEPTH_GLOBAL:
+        return f"系统队列已满 ({total}/{QUEUE_MAX_DEPTH_GLOBAL})", estimate_retry_after(total + count - QUEUE_MAX_DEPTH_GLOBAL)
+    return None
+
+def require_admission(user_id: str, count: int = 1, lane: str = "interactive"):
+    rejected = admission_error(user_id, count, lane)
+    if rejected:
+        reason, retry_after = rejected
+        raise HTTPException(status_code=429, detail=reason, headers={"Retry-After": str(retry_after)})
+
+async def cancel_on_disconnect(request: Request, coro):
+    """客户端断开就取消 coro (排队中的 LLM 请求出队，在途的断开连接)，不再白白占着槽位"""
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=1.0)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            raise HTTPException(status_code=499, detail="Client closed request")
+
 def require_admin(authorization: str | None) -> str:
     username = require_user(authorization)
     if username != SPECIAL_USER:
@@ -195,6 +295,7 @@ async def share_content(payload: SharePayload, x_api_key: str = Header(None)):
         raise HTTPException(status_code=403, detail="Invalid API Key")
 
     print(f"📱 收到手机分享: {payload.url}")
+    require_admission("mobile_user")
     job_id = str(uuid.uuid4())
     job = {
         "job_id": job_id,
@@ -228,6 +329,11 @@ async def reset(payload: ResetPayload):
         raise HTTPException(status_code=400, detail=msg)
     return {"status": "success"}
 
+@app.get("/admin/pools")
+async def admin_pools(authorization: str = Header(None)):
+    require_admin(authorization)
+    return {"pools": pool_stats(), "llm": gateway_stats()}
+
 @app.get("/admin/users")
 async def admin_users(authorization: str = Header(None)):
     require_admin(authorization)
@@ -260,6 +366,7 @@ async def admin_delete_user(username: str, authorization: str = Header(None)):
 @app.post("/ingest")
 async def ingest(payload: IngestPayload, authorization: str = Header(None)):
     username = require_user(authorization)
+    require_admission(username)
     job_id = str(uuid.uuid4())
     job = {
         "job_id": job_id,
@@ -268,11 +375,98 @@ async def ingest(payload: IngestPayload, authorization: str = Header(None)):
         "received_at": now_iso(),
         "source": "api",
         "process_mode": payload.mode,
-        "folder": payload.folder
+        "folder": payload.folder,
+        "freshness": payload.freshness,
     }
     write_inbox_job(job)
     return {"status": "accepted", "job_id": job_id}
 
+@app.post("/ingest/batch")
+async def ingest_batch(payload: BatchIngestPayload, authorization: str = Header(None)):
+    username = require_user(authorization)
+    items = [item.strip() for item in payload.items if item and item.strip()]
+    if not items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    max_items = min(BATCH_INGEST_MAX_ITEMS, QUEUE_MAX_DEPTH_PER_USER_BULK)
+    if len(items) > max_items:
+        raise HTTPException(status_code=413, detail=f"单批最多 {max_items} 条，请拆分成多批")
+
+    batch_id = str(uuid.uuid4())
+    received_at = now_iso()
+    jobs = [
+        {
+            "job_id": str(uuid.uuid4()),
+            "user_id": username,
+            "content": item,
+            "received_at": received_at,
+            "source": "import",
+            "process_mode": payload.mode,
+            "folder": payload.folder,
+            "freshness": payload.freshness,
+            "batch_id": batch_id,
+            "dedupe_key": ingest_dedupe_key(item, payload.mode),
+        }
+        for item in items
+    ]
+    # 准入按去重后的条数算 (批量通道单独计额度)
+    fresh, _ = job_queue.filter_duplicates(jobs)
+    require_admission(username, len(fresh), lane="bulk")
+    accepted, duplicates = job_queue.enqueue_many(jobs)
+    append_job_event(batch_id, "ACCEPTED", step="batch_enqueue", user_id=username,
+                     message=f"批量入队 {len(accepted)} 条，去重 {len(duplicates)} 条",
+                     extra={"accepted": len(accepted), "duplicates": len(duplicates)})
+    return {
+        "status": "accepted",
+        "batch_id": batch_id,
+        "accepted": len(accepted),
+        "duplicates": len(duplicates),
+        "job_ids": [job["job_id"] for job in accepted],
+    }
+
+@app.get("/ingest/batch/{batch_id}")
+async def ingest_batch_status(batch_id: str, authorization: str = Header(None)):
+    username = require_user(authorization)
+    # 只能看自己的批次，管理员不限
+    progress = job_queue.batch_progress(batch_id, None if username == SPECIAL_USER else username)
+    if not progress["total"]:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return progress
+
+@app.post("/api/feeds")
+async def subscribe_feed(payload: FeedPayload, authorization: str = Header(None)):
+    """订阅 RSS/Atom/站点地图，格式在首次拉取时自动识别"""
+    username = require_user(authorization)
+    url = payload.url.strip()
+    if not url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="Invalid feed url")
+    interval = max(payload.interval_minutes, FEED_MIN_INTERVAL_MINUTES)
+    feed = feed_store.add_feed(username, url, payload.folder, interval, max(payload.backfill, 0))
+    if not feed:
+        raise HTTPException(status_code=409, detail="Already subscribed")
+    return feed
+
+@app.get("/api/feeds")
+async def list_feeds(authorization: str = Header(None)):
+    username = require_user(authorization)
+    return {"feeds": feed_store.list_feeds(username)}
+
+@app.delete("/api/feeds/{feed_id}")
+async def unsubscribe_feed(feed_id: str, authorization: str = Header(None)):
+    username = require_user(authorization)
+    if not feed_store.delete_feed(feed_id, username):
+        raise HTTPException(status_code=404, detail="Feed not found")
+    return {"status": "deleted", "feed_id": feed_id}
+
+@app.post("/api/feeds/{feed_id}/poll")
+async def poll_feed_now(feed_id: str, authorization: str = Header(None)):
+    """立即拉取一次 (忽略轮询间隔)"""
+    username = require_user(authorization)
+    feed = feed_store.get_feed(feed_id)
+    if not feed or feed["user_id"] != username:
+        raise HTTPException(status_code=404, detail="Feed not found")
+    accepted = await poll_feed(feed, admission_error)
+    return {"feed_id": feed_id, "accepted": accepted, "feed": feed_store.get_feed(feed_id)}
+
 @app.post("/api/category")
 async def create_category(payload: CategoryPayload, authorization: str = Header(None)):
     username = require_user(authorization)
@@ -308,11 +502,8 @@ async def upload_file(
     folder: str | None = Form(None),
 ):
     username = require_user(authorization)
+    require_admission(username, lane="bulk")  # source=upload 走批量通道
     user_root = resolve_user_root(username)
-    try:
-        from markitdown import MarkItDown
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"MarkItDown 不可用: {e}")
 
     suffix = os.path.splitext(file.filename or "")[1]
     if not suffix:
@@ -322,7 +513,9 @@ async def upload_file(
         f.write(await file.read())
 
     try:
-        md = MarkItDown().convert(tmp_path).text_content
+        md = await run_blocking("cpu", convert_to_markdown, tmp_path)
+    except PoolBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"解析失败: {e}")
     finally:
@@ -360,6 +553,7 @@ async def ingest_voice(
     folder: str | None = Form(None),
 ):
     username = require_user(authorization)
+    require_admission(username)  # 先检查，别白白转写
     suffix = os.path.splitext(file.filename or "")[1]
     if not suffix:
         suffix = ".wav"
@@ -368,7 +562,10 @@ async def ingest_voice(
         f.write(await file.read())
 
     try:
-        text = transcribe_audio(tmp_path)
+        # Whisper 模型常驻在本进程，用线程池 (CTranslate2 推理会释放 GIL)
+        text = await run_blocking("model", transcribe_audio, tmp_path)
+    except PoolBusyError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"语音转文字失败: {e}")
     finally:
@@ -403,7 +600,7 @@ async def ingest_image(
 ):
     username = require_user(authorization)
     job_id = str(uuid.uuid4())
-    append_job_event(job_id, "RUNNING", step="start", user_id=username)
+    append_job_event(job_id, "RUNNING", step="start", user_id=username, extra={"source": "image"})
 
     suffix = os.path.splitext(file.filename or "")[1].lower() or ".jpg"
     tmp_path = os.path.join("/tmp", f"image_{uuid.uuid4().hex}{suffix}")
@@ -427,7 +624,10 @@ async def ingest_image(
 
     try:
         append_job_event(job_id, "RUNNING", step="vlm", user_id=username)
-        info = analyze_image(image_path)
+        info = await run_blocking("model", analyze_image, image_path)
+    except PoolBusyError:
+        append_job_event(job_id, "FAILED", step="vlm", user_id=username, error="model 池繁忙")
+        raise
     except Exception as e:
         append_job_event(job_id, "FAILED", step="vlm", user_id=username, error=str(e))
         raise HTTPException(status_code=500, detail=f"图片识别失败: {e}")
@@ -508,8 +708,8 @@ async def ingest_image(
 
     try:
         append_job_event(job_id, "RUNNING", step="save_vector_start", user_id=username)
-        save_to_vector_db(raw_data, ai_data, full_path, doc_id)
-        save_to_keyword_index(raw_data, ai_data)
+        await run_blocking("io", save_to_vector_db, raw_data, ai_data, full_path, doc_id)
+        await run_blocking("io", save_to_keyword_index, raw_data, ai_data)
         append_job_event(job_id, "SUCCESS", step="done", user_id=username, message="图片入库完成")
     except Exception as e:
         append_job_event(job_id, "FAILED", step="save_error", user_id=username, error=str(e))
@@ -521,14 +721,14 @@ async def ingest_image(
 async def api_rebuild_vectors(authorization: str = Header(None)):
     username = require_user(authorization)
     user_root = resolve_user_root(username)
-    count = rebuild_user_vectors(user_root, username)
+    count = await run_blocking("io", rebuild_user_vectors, user_root, username)
     return {"status": "success", "chunks": count}
 
 @app.post("/api/daily_summary")
 async def api_daily_summary(authorization: str = Header(None)):
     username = require_user(authorization)
     user_root = resolve_user_root(username)
-    path, msg = generate_daily_summary(user_root, username)
+    path, msg = await run_blocking("model", generate_daily_summary, user_root, username)
     if not path:
         raise HTTPException(status_code=400, detail=msg)
     return {"status": "success", "path": path, "mode": msg}
@@ -537,55 +737,251 @@ async def api_daily_summary(authorization: str = Header(None)):
 async def api_daily_list(offset: int = 0, authorization: str = Header(None)):
     username = require_user(authorization)
     user_root = resolve_user_root(username)
-    content = build_daily_list(user_root, username, offset)
+    content = await run_blocking("io", build_daily_list, user_root, username, offset)
     return {"content": content}
 
+CHAT_SYSTEM_PROMPT = "你是一个有用的助手。"
+
+async def chat_context(query: str, username: str) -> str:
+    hits = await run_blocking("io", hybrid_search, query, top_k=8, user_id=username)
+    docs = [h.get("content", "") for h in hits if h.get("content")]
+    return "\n\n".join([f"【来源{i+1}】: {d}" for i, d in enumerate(docs[:6])])
+
+def correction_prompt_for(draft: str, context_str: str) -> str:
+    return (
+        "你是一个审校助手。请依据【知识库片段】对【初稿回答】进行纠偏：\n"
+        "1) 如果初稿与知识库冲突，必须修正。\n"
+        "2) 如果初稿有缺失且知识库有信息，请补充。\n"
+        "3) 不要添加知识库之外的新事实。\n"
+        "4) 输出最终答案，保持回答详细。\n"
+        f"\n【初稿回答】:\n{draft}\n"
+        f"\n【知识库片段】:\n{context_str}\n"
+    )
+
+async def relay_tokens(messages: list, caller: str, parts: list, temperature: float = 0.7, max_tokens: int | None = None):
+    """把网关的流式增量转成 SSE token 事件，完整文本累积到 parts"""
+    gen = stream_complete(messages, caller=caller, priority="interactive",
+                          temperature=temperature, max_tokens=max_tokens)
+    try:
+        async for text in gen:
+            parts.append(text)
+            yield _sse("token", {"text": text})
+    finally:
+        await gen.aclose()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 @app.post("/api/chat")
-async def api_chat(payload: dict, authorization: str = Header(None)):
+async def api_chat(payload: dict, request: Request, authorization: str = Header(None)):
     username = require_user(authorization)
     query = (payload.get("query") or "").strip()
     if not query:
         raise HTTPException(status_code=400, detail="Empty query")
 
-    hits = hybrid_search(query, top_k=8, user_id=username)
-    docs = [h.get("content", "") for h in hits if h.get("content")]
-    context_str = "\n\n".join([f"【来源{i+1}】: {d}" for i, d in enumerate(docs[:6])])
+    context_str = await chat_context(query, username)
 
     if not context_str:
         # 无命中则走通用对话
-        answer = llm_chat(query)
+        answer = await cancel_on_disconnect(request, achat(query))
         return {"answer": answer}
 
     # 纠偏式回答
-    draft = llm_chat(query)
-    correction_prompt = (
-        "你是一个审校助手。请依据【知识库片段】对【初稿回答】进行纠偏：\n"
-        "1) 如果初稿与知识库冲突，必须修正。\n"
-        "2) 如果初稿有缺失且知识库有信息，请补充。\n"
-        "3) 不要添加知识库之外的新事实。\n"
-        "4) 输出最终答案，保持回答详细。\n"
-        f"\n【初稿回答】:\n{draft}\n"
-        f"\n【知识库片段】:\n{context_str}\n"
-    )
-    answer = llm_chat(query, system_prompt=correction_prompt)
+    draft = await cancel_on_disconnect(request, achat(query))
+    correction_prompt = correction_prompt_for(draft, context_str)
+    answer = await cancel_on_disconnect(request, achat(query, system_prompt=correction_prompt))
     return {"answer": answer}
 
+@app.post("/api/chat/stream")
+async def api_chat_stream(payload: dict, authorization: str = Header(None)):
+    """
+    /api/chat 的 SSE 版：模型每吐出一段就推一个 token 事件。
+    有知识库命中时先推 phase=draft 的初稿，再推 phase=answer 的纠偏结果；最后 done 带完整答案。
+    """
+    username = require_user(authorization)
+    query = (payload.get("query") or "").strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="Empty query")
+
+    context_str = await chat_context(query, username)
+
+    async def event_stream():
+        try:
+            if context_str:
+                draft_parts = []
+                yield _sse("phase", {"phase": "draft"})
+                async for event in relay_tokens([
+                    {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+                    {"role": "user", "content": query},
+                ], "chat", draft_parts, max_tokens=2000):
+                    yield event
+                system_prompt = correction_prompt_for("".join(draft_parts), context_str)
+            else:
+                system_prompt = CHAT_SYSTEM_PROMPT
+            parts = []
+            yield _sse("phase", {"phase": "answer"})
+            async for event in relay_tokens([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": query},
+            ], "chat", parts, max_tokens=2000):
+                yield event
+        except Exception as e:
+            yield _sse("error", {"detail": f"LLM error: {e}"})
+            return
+        yield _sse("done", {"answer": "".join(parts)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/api/llm/chat")
+async def api_llm_chat(payload: LLMChatPayload, request: Request, authorization: str = Header(None)):
+    """Web UI 的意图判断和 RAG 问答走这里，和后台分析共用同一个 LLM 网关 (interactive 优先级)"""
+    require_user(authorization)
+    if not payload.messages:
+        raise HTTPException(status_code=400, detail="Empty messages")
+    try:
+        data = await cancel_on_disconnect(request, complete(
+            payload.messages,
+            caller=payload.caller,
+            priority="interactive",
+            temperature=payload.temperature,
+            max_tokens=payload.max_tokens,
+        ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"LLM error: {e}")
+    return {"content": message_text(data), "usage": data.get("usage") or {}}
+
+@app.post("/api/llm/chat/stream")
+async def api_llm_chat_stream(payload: LLMChatPayload, authorization: str = Header(None)):
+    """/api/llm/chat 的 SSE 版，Web UI 聊天页边收边渲染"""
+    require_user(authorization)
+    if not payload.messages:
+        raise HTTPException(status_code=400, detail="Empty messages")
+
+    async def event_stream():
+        parts = []
+        try:
+            async for event in relay_tokens(payload.messages, payload.caller, parts,
+                                            temperature=payload.temperature, max_tokens=payload.max_tokens):
+                yield event
+        except Exception as e:
+            yield _sse("error", {"detail": f"LLM error: {e}"})
+            return
+        yield _sse("done", {"content": "".join(parts)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 
 
 # ✨ 新增：状态查询接口
 @app.get("/api/status/{job_id}")
 async def check_job_status(job_id: str):
-    return get_job_latest_status(job_id)
+    status = get_job_latest_status(job_id)
+    position = job_queue.queue_position(job_id)
+    if position is not None:
+        status["queue_position"] = position
+    return status
+
+@app.get("/api/status/{job_id}/stream")
+async def stream_job_status(job_id: str, request: Request):
+    """SSE：append_job_event 记下状态变化时立即推送，到终态 (SUCCESS*/FAILED) 后关闭"""
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        q: asyncio.Queue = asyncio.Queue()
+        subscribe_job(job_id, loop, q)
+        try:
+            current = await check_job_status(job_id)
+            yield _sse("status", current)
+            if job_log.is_terminal(current.get("status", "")):
+                return
+            deadline = loop.time() + JOB_STREAM_MAX_SECONDS
+            while loop.time() < deadline:
+                if await request.is_disconnected():
+                    return
+                try:
+                    info = await asyncio.wait_for(q.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse("status", info)
+                if job_log.is_terminal(info.get("status", "")):
+                    return
+        finally:
+            unsubscribe_job(job_id, loop, q)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/jobs")
+async def list_jobs(
+    authorization: str = Header(None),
+    user: str | None = None,
+    status: str | None = None,
+    source: str | None = None,
+    step: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    cursor: str | None = None,
+    limit: int = 50,
+):
+    """
+    任务历史查询：status 可逗号分隔多个；since/until 为 ISO 时间 (如 2025-12-22T00:00:00)。
+    普通用户只能看自己的任务，管理员可按 user 过滤或查看全部。
+    """
+    username = require_user(authorization)
+    if username != SPECIAL_USER:
+        if user and user != username:
+            raise HTTPException(status_code=403, detail="Admin only")
+        user = username
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    try:
+        return await run_blocking(
+            "io", job_log.query_jobs,
+            user_id=user, status=statuses, source=source, step=step,
+            since=since, until=until, cursor=cursor, limit=max(1, min(limit, 500)),
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.post("/api/jobs/{job_id}/retry")
+async def retry_job(job_id: str, authorization: str = Header(None)):
+    username = require_user(authorization)
+    job = job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["user_id"] != username and username != SPECIAL_USER:
+        raise HTTPException(status_code=403, detail="Not your job")
+    if not job_queue.requeue(job_id):
+        raise HTTPException(status_code=400, detail=f"Job 当前状态为 {job['status']}，只有死信任务可以重试")
+    append_job_event(job_id, "RUNNING", step="requeue", user_id=username, message="手动重试")
+    return {"status": "accepted", "job_id": job_id}
 
 @app.post("/prune")
 async def api_prune_db(authorization: str = Header(None)):
     try:
         username = require_user(authorization)
         user_root = resolve_user_root(username)
-        return sync_prune_vectors(user_root)
+        return await run_blocking("io", sync_prune_vectors, user_root)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@metrics.register_collector
+def collect_runtime_metrics():
+    metrics.QUEUE_DEPTH.clear()
+    for status, priority, count in job_queue.queue_depths():
+        metrics.QUEUE_DEPTH.set(count, status=status, priority=priority)
+    metrics.CRAWL_CACHE_BYTES.set(crawl_cache.cache_stats()["bytes"])
+    for name, stats in pool_stats().items():
+        metrics.POOL_INFLIGHT.set(stats["inflight"], pool=name)
+        for key in ("completed", "failed", "rejected"):
+            metrics.POOL_TASKS.set_total(stats[key], pool=name, result=key)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/healthz")
 async def healthz():
     return PlainTextResponse("ok")
@@ -607,8 +1003,11 @@ async def receive_msg(request: Request, msg_signature: str, timestamp: str, nonc
         msg = xmltodict.parse(xml)['xml']
         
         if msg.get('MsgType') == 'text':
+            rejected = admission_error(msg.get('FromUserName', ''))
             if SYSTEM_STATE["error"]:
                 reply = f"⚠️ IP 限制未解除: {SYSTEM_STATE['msg']}"
+            elif rejected:
+                reply = f"⏳ {rejected[0]}，请约 {rejected[1]} 秒后再发"
             else:
                 job_id = str(uuid.uuid4())
                 write_inbox_job({
@@ -628,51 +1027,147 @@ async def receive_msg(request: Request, msg_signature: str, timestamp: str, nonc
     except InvalidSignatureException:
         return "fail"
 
-# === 6. Worker 逻辑 (已修复变量作用域错误) ===
-WORKER_LOCK = asyncio.Lock()
-async def inbox_worker_loop():
-    print("🧵 Inbox Worker 启动")
+# === 6. Worker 逻辑 (多 worker 并发，阶段限流见 core.pipeline.STAGE_LIMITS) ===
+async def keep_claim_alive(job_id: str):
+    """任务执行期间定期续约，防止排队等 LLM 时被当作超时重新认领"""
     while True:
-        await asyncio.sleep(1.5)
-        if not list_inbox_jobs(): 
+        await asyncio.sleep(QUEUE_VISIBILITY_TIMEOUT / 3)
+        job_queue.extend_claim(job_id)
+
+async def run_inbox_job(job: dict):
+    job_id = job["job_id"]
+    heartbeat = asyncio.create_task(keep_claim_alive(job_id))
+    t0 = time.perf_counter()
+    result = "success"
+    metrics.JOBS_IN_FLIGHT.inc()
+    try:
+        mode = job.get("process_mode", "auto")
+        folder = job.get("folder")
+
+        append_job_event(job_id, "RUNNING", step="worker_pick", user_id=job.get("user_id", ""),
+                         extra={"source": job.get("source")})
+
+        await process_content_to_obsidian(
+            job_id,
+            job["content"],
+            job["user_id"],
+            mode=mode,
+            folder=folder,
+            freshness=job.get("freshness"),
+        )
+
+        job_queue.ack(job_id)
+    except StageError as e:
+        result = "failed"
+        await handle_job_failure(job, e.stage, str(e))
+    except Exception as e:
+        result = "failed"
+        print(f"❌ Worker 异常: {e}")
+        await handle_job_failure(job, "worker", str(e))
+    finally:
+        heartbeat.cancel()
+        metrics.JOBS_IN_FLIGHT.dec()
+        metrics.JOB_SECONDS.observe(time.perf_counter() - t0, result=result)
+        metrics.JOBS_TOTAL.inc(result=result)
+
+async def handle_job_failure(job: dict, stage: str, error: str):
+    """失败后退避重试，次数用完进死信并通知用户"""
+    job_id = job["job_id"]
+    status, delay = job_queue.retry_or_dead(job_id, f"{stage}: {error}")
+    if status == "queued":
+        append_job_event(job_id, "RETRYING", step=stage, error=error, message=f"{delay}s 后重试")
+        print(f"🔁 [Job {job_id[:8]}] {stage} 失败，{delay}s 后重试: {error}")
+    else:
+        append_job_event(job_id, "FAILED", step=stage, error=error, message="重试次数用完，已进入死信")
+        await send_wecom_msg(job.get("user_id", ""), f"❌ 入库失败: {error}")
+
+async def reap_expired_claims():
+    """认领超时且重试次数用完的任务进死信 (和 handle_job_failure 的死信分支一样记日志、通知)"""
+    for job in job_queue.dead_letter_expired():
+        error = "认领超时：worker 多次中途退出"
+        append_job_event(job["job_id"], "FAILED", step="claim", user_id=job.get("user_id", ""),
+                         error=error, message="重试次数用完，已进入死信")
+        await send_wecom_msg(job.get("user_id", ""), f"❌ 入库失败: {error}")
+
+async def inbox_worker_loop(worker_id: int):
+    # 前 N 个 worker 只接交互任务，保证批量导入排满时单条分享也能秒级开工
+    reserved = worker_id < QUEUE_INTERACTIVE_RESERVED_WORKERS
+    max_priority = QUEUE_PRIORITY_INTERACTIVE if reserved else None
+    print(f"🧵 Inbox Worker #{worker_id} 启动{' (交互专用)' if reserved else ''}")
+    while True:
+        job_queue.reset_wakeup()
+        job = job_queue.claim(max_priority)
+        if not job:
+            await reap_expired_claims()
+            await job_queue.wait_for_job(QUEUE_POLL_INTERVAL)
             continue
-        
-        async with WORKER_LOCK:
-            jobs = list_inbox_jobs()
-            if not jobs: continue
-            job_path = jobs[0]
-            
-            try:
-                # 1. 先读取文件
-                with open(job_path, "r", encoding="utf-8") as f:
-                    job = json.load(f)
-                
-                # 2. ✅ 现在可以安全获取 mode 了
-                mode = job.get("process_mode", "auto")
-                folder = job.get("folder")
-
-                # 3. 执行业务
-                append_job_event(job["job_id"], "RUNNING", step="worker_pick")
-                
-                await process_content_to_obsidian(
-                    job["job_id"], 
-                    job["content"], 
-                    job["user_id"],
-                    mode=mode,
-                    folder=folder
-                )
-                
-                mark_inbox_done(job_path)
-            except Exception as e:
-                print(f"❌ Worker 异常: {e}")
-                error_path = job_path + ".err"
-                if os.path.exists(job_path):
-                    os.rename(job_path, error_path)
+        await run_inbox_job(job)
+
+async def queue_maintenance_loop():
+    while True:
+        purged = job_queue.purge_finished()
+        if purged:
+            print(f"🧹 清理已完成任务 {purged} 条")
+        try:
+            await reap_expired_claims()   # worker 一直忙时 (不空闲) 也要定期收掉
+        except Exception as e:
+            print(f"⚠️ 死信回收失败: {e}")
+        try:
+            await run_blocking("io", job_log.compact_segments)
+            removed = await run_blocking("io", job_log.purge_segments)
+            if removed:
+                print(f"🧹 删除过期日志分段 {removed} 个")
+        except Exception as e:
+            print(f"⚠️ 日志维护失败: {e}")
+        try:
+            await run_blocking("io", feed_store.purge_seen)
+        except Exception as e:
+            print(f"⚠️ 订阅记录清理失败: {e}")
+        try:
+            evicted = await run_blocking("io", crawl_cache.evict)
+            if evicted:
+                print(f"🧹 淘汰抓取缓存 {evicted} 条")
+        except Exception as e:
+            print(f"⚠️ 抓取缓存清理失败: {e}")
+        await asyncio.sleep(3600)
+
+async def feed_poll_loop():
+    """定时拉取到期的订阅；单个订阅出错只影响它自己 (在 feed_store 里退避)"""
+    while True:
+        try:
+            for feed in await run_blocking("io", feed_store.due_feeds):
+                await poll_feed(feed, admission_error)
+        except Exception as e:
+            print(f"⚠️ 订阅轮询异常: {e}")
+        await asyncio.sleep(FEED_POLL_TICK)
 
 @app.on_event("startup")
 async def startup():
     init_auth_db()
-    asyncio.create_task(inbox_worker_loop())
+    job_queue.init_queue_db()
+    crawl_cache.init_cache_db()
+    feed_store.init_feeds_db()
+    job_queue.bind_loop()
+    bind_llm_loop()
+    # cpu 进程池 (forkserver) 启动较慢，提前拉起并加载正文抽取/文档转换用到的模块
+    warm_pools(("utils.html_extract", "utils.doc_convert", "trafilatura"))
+    load_status_index()
+    backfilled = await run_blocking("io", backfill_document_registry)
+    if backfilled:
+        print(f"📇 补登记历史文档 {backfilled} 篇")
+    imported = import_legacy_inbox()
+    if imported:
+        print(f"♻️ 导入旧版 inbox 任务 {imported} 个")
+    for i in range(WORKER_CONCURRENCY):
+        asyncio.create_task(inbox_worker_loop(i))
+    asyncio.create_task(queue_maintenance_loop())
+    asyncio.create_task(feed_poll_loop())
+
+@app.on_event("shutdown")
+async def shutdown():
+    shutdown_pools()
+    await close_clients()
+    flush_job_log()
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8888, reload=True,
@@ -0,0 +1,247 @@
+"""
+抓取基准：用本地 HTTP 服务回放 scripts/bench_fixtures/<站点>/*.html，
+离线评估 core/crawler.py 的本地抽取速度和效果，改动前后对比用。
+样本从 127.0.0.1 下载，但抽取时用 SITE_URLS 里的站点地址，域名专用抽取器才会命中；
+EXPECTED_EXTRACTORS 里的站点没走到对应抽取器时以非零状态退出。
+
+    python -m scripts.bench_crawler                       # 全部站点，并发 4，每页 5 轮
+    python -m scripts.bench_crawler --site zhihu -n 20
+    python -m scripts.bench_crawler --json before.json    # 保存结果，方便前后对比
+    python -m scripts.bench_crawler --record zhihu https://zhuanlan.zhihu.com/p/xxx   # 录制新样本 (需要联网)
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+# 样本目录 -> 抽取时使用的站点地址前缀 (没列出的站点直接用本地地址)
+SITE_URLS = {
+    "zhihu": "https://www.zhihu.com/question/",
+    "weixin": "https://mp.weixin.qq.com/s/",
+    "xiaohongshu": "https://www.xiaohongshu.com/explore/",
+}
+# 样本目录 -> 必须命中的抽取器
+EXPECTED_EXTRACTORS = {"zhihu": "zhihu", "weixin": "weixin"}
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server(root: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def collect_pages(site: str | None = None) -> dict[str, list[str]]:
+    """站点 -> 相对路径列表"""
+    pages = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        path = os.path.join(FIXTURES_DIR, name)
+        if not os.path.isdir(path) or (site and name != site):
+            continue
+        files = sorted(fn for fn in os.listdir(path) if fn.endswith((".html", ".htm")))
+        if files:
+            pages[name] = [f"{name}/{fn}" for fn in files]
+    return pages
+
+
+def peak_rss_mb() -> tuple[float, float]:
+    """(主进程, 已回收子进程) 的峰值 RSS (MB)，Linux 上 ru_maxrss 单位是 KB"""
+    div = 1024 * 1024 if sys.platform == "darwin" else 1024   # macOS 上单位是字节
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / div
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / div
+    return round(own, 1), round(children, 1)
+
+
+def logical_url(site: str, path: str, n: int | str) -> str | None:
+    prefix = SITE_URLS.get(site)
+    if not prefix:
+        return None
+    return f"{prefix}{os.path.splitext(os.path.basename(path))[0]}?bench={n}"
+
+
+async def fetch_and_extract(crawler, url: str, site_url: str | None) -> dict | None:
+    """
+    和 fetch_via_trafilatura 同样的下载 + 进程池抽取，只是缓存键和抽取用站点地址。
+    没有站点地址时直接走 fetch_via_trafilatura。
+    """
+    from utils.executors import run_blocking
+    from utils.html_extract import extract_article
+
+    if not site_url:
+        res = await crawler.fetch_via_trafilatura(url)
+        return {"text": res["content"], "extractor": None} if res else None
+    try:
+        status, html, _, _ = await crawler._cached_get("crawl", "page", site_url, url)
+        if status != 200 or not html:
+            return None
+        return await run_blocking("cpu", extract_article, html, site_url)
+    except Exception as e:
+        print(f"⚠️ 抽取失败 {site_url}: {e}")
+        return None
+
+
+async def bench_site(crawler, base_url: str, site: str, paths: list[str], repeat: int, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, lengths, extractors = [], [], {}
+    counter = iter(range(10 ** 9))
+
+    async def one(path: str):
+        # 每次带不同的 query，绕开抓取缓存，测的是完整的下载 + 抽取
+        n = next(counter)
+        url = f"{base_url}/{path}?bench={n}"
+        async with sem:
+            t0 = time.perf_counter()
+            res = await fetch_and_extract(crawler, url, logical_url(site, path, n))
+            latencies.append(time.perf_counter() - t0)
+        lengths.append(len(res["text"]) if res else 0)
+        name = (res or {}).get("extractor") or "-"
+        extractors[name] = extractors.get(name, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(p) for _ in range(repeat) for p in paths))
+    wall = time.perf_counter() - t0
+    ok = sum(1 for n in lengths if n)
+    return {
+        "pages": len(latencies),
+        "ok": ok,
+        "pages_per_sec": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "avg_chars": round(sum(lengths) / ok) if ok else 0,
+        "extractors": extractors,
+    }
+
+
+def extractor_mismatches(result: dict) -> list[str]:
+    """EXPECTED_EXTRACTORS 里的站点，每一页都得由对应抽取器产出"""
+    problems = []
+    for site, expected in EXPECTED_EXTRACTORS.items():
+        s = result["sites"].get(site)
+        if s and s["extractors"] != {expected: s["pages"]}:
+            problems.append(f"{site}: 期望全部由 {expected} 抽取，实际 {s['extractors']}")
+    return problems
+
+
+async def run_bench(pages: dict[str, list[str]], repeat: int, concurrency: int) -> dict:
+    from core import crawler
+    from utils import crawl_cache
+    from utils.executors import shutdown_pools
+    from utils.http_client import close_clients
+
+    # 缓存写到临时库，不污染 data/crawl_cache.db
+    crawl_cache.CRAWL_CACHE_DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bench_"), "crawl_cache.db")
+    crawl_cache.init_cache_db()
+    # 本地回放服务不需要限流
+    crawler._limiters["127.0.0.1"] = crawler._HostLimiter(rate=1e9, burst=10 ** 9, max_inflight=concurrency)
+
+    server = start_server(FIXTURES_DIR)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # 预热：拉起进程池、建立连接，不计入结果
+        site, paths = next(iter(pages.items()))
+        await fetch_and_extract(crawler, f"{base_url}/{paths[0]}?bench=warmup", logical_url(site, paths[0], "warmup"))
+
+        sites = {}
+        t0 = time.perf_counter()
+        for site, paths in pages.items():
+            sites[site] = await bench_site(crawler, base_url, site, paths, repeat, concurrency)
+        wall = time.perf_counter() - t0
+    finally:
+        server.shutdown()
+        await close_clients()
+        shutdown_pools(wait=True)   # 等子进程退出，RUSAGE_CHILDREN 才统计得到
+
+    total = sum(s["pages"] for s in sites.values())
+    rss_main, rss_children = peak_rss_mb()
+    return {
+        "sites": sites,
+        "total": {
+            "pages": total,
+            "pages_per_sec": round(total / wall, 2) if wall else 0.0,
+            "peak_rss_mb": rss_main,
+            "peak_rss_children_mb": rss_children,
+        },
+        "repeat": repeat,
+        "concurrency": concurrency,
+    }
+
+
+def print_report(result: dict):
+    print(f"{'站点':<14}{'页数':>6}{'成功':>6}{'页/秒':>9}{'p50(ms)':>10}{'p99(ms)':>10}{'平均字数':>10}  抽取器")
+    for site, s in result["sites"].items():
+        used = ", ".join(f"{k}×{v}" for k, v in sorted(s["extractors"].items()))
+        print(f"{site:<14}{s['pages']:>6}{s['ok']:>6}{s['pages_per_sec']:>9}{s['p50_ms']:>10}{s['p99_ms']:>10}{s['avg_chars']:>10}  {used}")
+    t = result["total"]
+    print(f"\n📊 合计 {t['pages']} 页，{t['pages_per_sec']} 页/秒；"
+          f"峰值 RSS 主进程 {t['peak_rss_mb']} MB，抽取子进程 {t['peak_rss_children_mb']} MB")
+
+
+def record(site: str, urls: list[str]):
+    """联网抓取原始 HTML 存成样本 (只存下载结果，不做抽取)"""
+    import httpx
+    from config import FAKE_HEADERS
+    from utils.helpers import url_hash
+
+    out_dir = os.path.join(FIXTURES_DIR, site)
+    os.makedirs(out_dir, exist_ok=True)
+    with httpx.Client(headers=FAKE_HEADERS, follow_redirects=True, timeout=30.0) as client:
+        for url in urls:
+            resp = client.get(url)
+            path = os.path.join(out_dir, f"{url_hash(url)}.html")
+            with open(path, "wb") as f:
+                f.write(resp.content)
+            print(f"💾 {url} -> {path} ({resp.status_code}, {len(resp.content)} 字节)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线抓取基准")
+    parser.add_argument("--site", help="只跑某个站点目录")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="每个页面重复次数")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--record", nargs="+", metavar=("SITE", "URL"), help="录制样本：站点名 + URL 列表")
+    args = parser.parse_args()
+
+    if args.record:
+        if len(args.record) < 2:
+            parser.error("--record 需要站点名和至少一个 URL")
+        record(args.record[0], args.record[1:])
+        return
+
+    pages = collect_pages(args.site)
+    if not pages:
+        parser.error(f"{FIXTURES_DIR} 下没有样本")
+    result = asyncio.run(run_bench(pages, args.repeat, args.concurrency))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    problems = extractor_mismatches(result)
+    for p in problems:
+        print(f"❌ {p}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# 抓取缓存：按 normalize_url 存 zlib 压缩后的正文和 ETag/Last-Modified，过期后走条件请求
+import time
+import zlib
+import sqlite3
+from config import CRAWL_CACHE_DB_PATH, CRAWL_CACHE_FRESH_SECONDS, CRAWL_CACHE_TTL_DAYS, CRAWL_CACHE_MAX_BYTES
+from utils.helpers import normalize_url
+
+
+def _connect():
+    conn = sqlite3.connect(CRAWL_CACHE_DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def init_cache_db():
+    conn = _connect()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS crawl_cache (
+            kind TEXT NOT NULL,
+            url TEXT NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (kind, url)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_cache_accessed ON crawl_cache (accessed_at)")
+    conn.commit()
+    conn.close()
+
+
+def lookup(kind: str, url: str) -> dict | None:
+    """
+    kind 区分同一 URL 的不同抓取方式 (page=原网页 HTML, jina=Jina Reader 输出)。
+    fresh=True 表示还在新鲜期内，可以不发请求直接用。
+    """
+    key = normalize_url(url)
+    conn = _connect()
+    row = conn.execute(
+        "SELECT body, etag, last_modified, fetched_at FROM crawl_cache WHERE kind = ? AND url = ?",
+        (kind, key),
+    ).fetchone()
+    if row:
+        conn.execute("UPDATE crawl_cache SET accessed_at = ? WHERE kind = ? AND url = ?", (time.time(), kind, key))
+        conn.commit()
+    conn.close()
+    if not row:
+        return None
+    try:
+        body = zlib.decompress(row[0]).decode("utf-8")
+    except (zlib.error, UnicodeDecodeError):
+        return None
+    return {
+        "body": body,
+        "etag": row[1],
+        "last_modified": row[2],
+        "fresh": time.time() - row[3] < CRAWL_CACHE_FRESH_SECONDS,
+    }
+
+
+def conditional_headers(entry: dict) -> dict:
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def store(kind: str, url: str, body: str, etag: str | None = None, last_modified: str | None = None):
+    blob = zlib.compress(body.encode("utf-8"), 6)
+    now = time.time()
+    conn = _connect()
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO crawl_cache (kind, url, body, size, etag, last_modified, fetched_at, accessed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (kind, normalize_url(url), blob, len(blob), etag, last_modified, now, now),
+    )
+    conn.commit()
+    conn.close()
+
+
+def mark_revalidated(kind: str, url: str):
+    """服务器回了 304：内容没变，重新计算新鲜期"""
+    now = time.time()
+    conn = _connect()
+    conn.execute(
+        "UPDATE crawl_cache SET fetched_at = ?, accessed_at = ? WHERE kind = ? AND url = ?",
+        (now, now, kind, normalize_url(url)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def evict(ttl_days: int = CRAWL_CACHE_TTL_DAYS, max_bytes: int = CRAWL_CACHE_MAX_BYTES) -> int:
+    """先删过期条目，再按最久未访问淘汰到总大小以内，返回删除条数"""
+    conn = _connect()
+    removed = conn.execute(
+        "DELETE FROM crawl_cache WHERE accessed_at < ?", (time.time() - ttl_days * 86400,)
+    ).rowcount
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM crawl_cache").fetchone()[0]
+    if total > max_bytes:
+        victims = []
+        for kind, url, size in conn.execute("SELECT kind, url, size FROM crawl_cache ORDER BY accessed_at"):
+            if total <= max_bytes:
+                break
+            victims.append((kind, url))
+            total -= size
+        conn.executemany("DELETE FROM crawl_cache WHERE kind = ? AND url = ?", victims)
+        removed += len(victims)
+    conn.commit()
+    conn.close()
+    return removed
+
+
+def cache_stats() -> dict:
+    conn = _connect()
+    entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM crawl_cache").fetchone()
+    conn.close()
+    return {"entries": entries, "bytes": size}
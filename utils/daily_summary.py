@@ -2,10 +2,8 @@ import os
 import datetime
 from pathlib import Path
 
-import httpx
-
-from config import LLM_API_URL, LLM_MODEL
 from core.storage import collection as chroma_collection
+from core.llm import complete_sync, message_text
 
 
 def _strip_frontmatter(text: str) -> str:
@@ -156,19 +154,14 @@ def generate_daily_summary(user_root: str, user_id: str, date_str: str | None =
         "- ...\n"
     )
 
-    payload = {
-        "model": LLM_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": content_text},
-        ],
-        "temperature": 0.5,
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": content_text},
+    ]
 
     try:
-        resp = httpx.post(LLM_API_URL, json=payload, timeout=120)
-        data = resp.json()
-        summary = data["choices"][0]["message"]["content"]
+        data = complete_sync(messages, caller="daily_summary", priority="batch", temperature=0.5, timeout=120)
+        summary = message_text(data)
     except Exception as e:
         return None, f"LLM 生成失败: {e}"
 
@@ -0,0 +1,4 @@
+def convert_to_markdown(path: str) -> str:
+    """MarkItDown 转换 (模块级函数，方便丢进进程池)"""
+    from markitdown import MarkItDown
+    return MarkItDown().convert(path).text_content
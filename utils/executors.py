@@ -0,0 +1,141 @@
+import time
+import asyncio
+import functools
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from config import EXECUTOR_POOLS
+
+
+def _process_context():
+    """
+    进程池不用默认的 fork：服务里已经有日志写线程、线程池、chromadb 在跑，
+    fork 出来的子进程可能继承一把被别的线程持有的锁然后死锁。
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _preload(modules: tuple[str, ...]):
+    """预热任务：在子进程里提前 import 重模块，第一次真实调用不用再等"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"⚠️ 预加载 {name} 失败: {e}")
+
+
+class PoolBusyError(Exception):
+    """池子排队已满，调用方应返回 503 让客户端稍后重试"""
+
+
+class ManagedPool:
+    """带排队上限和计数的执行器包装，executor 首次使用时才创建"""
+
+    def __init__(self, name: str, kind: str, workers: int, max_queue: int):
+        self.name = name
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_process_context())
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                            thread_name_prefix=f"pool-{self.name}")
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self.inflight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PoolBusyError(f"{self.name} 池已满 ({self.inflight} 个任务在途)")
+            self.inflight += 1
+            self.submitted += 1
+        t0 = time.perf_counter()
+        try:
+            future = self._get_executor().submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            with self._lock:
+                self.inflight -= 1
+                self.failed += 1
+            raise
+        # 计数挂在执行器的 future 上：调用方被取消时任务可能还在跑，要等它真正结束才算出队
+        future.add_done_callback(functools.partial(self._on_done, t0))
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, t0: float, future):
+        with self._lock:
+            self.inflight -= 1
+            self.busy_seconds += time.perf_counter() - t0
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "inflight": self.inflight,
+            "queued": max(self.inflight - self.workers, 0),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+    def warm(self, preload: tuple[str, ...] = ()):
+        """进程池启动时预热：把 worker 进程拉起来并 import 重模块 (不等结果，不计入统计)"""
+        if self.kind != "process":
+            return
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_preload, preload)
+
+    def shutdown(self, wait: bool = False):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+
+POOLS = {name: ManagedPool(name, **cfg) for name, cfg in EXECUTOR_POOLS.items()}
+
+
+async def run_blocking(pool: str, fn, *args, **kwargs):
+    """
+    把阻塞调用丢到指定池子里执行，不占用事件循环。
+    process 池要求 fn 和参数可 pickle (模块级函数)。
+    """
+    return await POOLS[pool].run(fn, *args, **kwargs)
+
+
+def pool_stats() -> dict:
+    return {name: pool.stats() for name, pool in POOLS.items()}
+
+
+def warm_pools(preload: tuple[str, ...] = ()):
+    for pool in POOLS.values():
+        pool.warm(preload)
+
+
+def shutdown_pools(wait: bool = False):
+    for pool in POOLS.values():
+        pool.shutdown(wait)
@@ -0,0 +1,95 @@
+# RSS / Atom / 站点地图解析 (模块级纯函数，可以丢进 cpu 进程池)
+import datetime
+import email.utils
+import xml.etree.ElementTree as ET
+
+
+def _local(tag: str) -> str:
+    """去掉命名空间：{http://www.w3.org/2005/Atom}entry -> entry"""
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _child(elem, name: str):
+    for c in elem:
+        if _local(c.tag) == name:
+            return c
+    return None
+
+
+def _text(elem, name: str) -> str:
+    c = _child(elem, name)
+    return (c.text or "").strip() if c is not None else ""
+
+
+def normalize_date(value: str) -> str | None:
+    """RFC 822 (RSS) 或 ISO 8601 (Atom/sitemap) -> UTC 的 YYYY-MM-DDTHH:MM:SS，便于和高水位直接比较"""
+    if not value:
+        return None
+    dt = None
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        try:
+            dt = datetime.datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _atom_link(entry) -> str:
+    fallback = ""
+    for c in entry:
+        if _local(c.tag) != "link":
+            continue
+        rel = c.get("rel", "alternate")
+        if rel == "alternate":
+            return c.get("href", "").strip()
+        fallback = fallback or c.get("href", "").strip()
+    return fallback
+
+
+def parse_feed(data: bytes) -> dict:
+    """
+    返回 {"kind": rss/atom/sitemap/sitemapindex, "entries": [{"link", "title", "published"}]}。
+    sitemapindex 的 entries 是子站点地图地址。published 可能为 None。
+    """
+    root = ET.fromstring(data)
+    kind = _local(root.tag)
+    entries = []
+    if kind == "rss" or kind == "RDF":
+        channel = _child(root, "channel")
+        items = [c for c in (channel if channel is not None and kind == "rss" else root) if _local(c.tag) == "item"]
+        for item in items:
+            published = _text(item, "pubDate") or _text(item, "date")   # RSS 1.0 用 dc:date
+            entries.append({
+                "link": _text(item, "link") or _text(item, "guid"),
+                "title": _text(item, "title"),
+                "published": normalize_date(published),
+            })
+        kind = "rss"
+    elif kind == "feed":
+        for entry in root:
+            if _local(entry.tag) != "entry":
+                continue
+            entries.append({
+                "link": _atom_link(entry),
+                "title": _text(entry, "title"),
+                "published": normalize_date(_text(entry, "published") or _text(entry, "updated")),
+            })
+        kind = "atom"
+    elif kind in ("urlset", "sitemapindex"):
+        tag = "url" if kind == "urlset" else "sitemap"
+        for node in root:
+            if _local(node.tag) != tag:
+                continue
+            entries.append({
+                "link": _text(node, "loc"),
+                "title": "",
+                "published": normalize_date(_text(node, "lastmod")),
+            })
+        kind = "sitemap" if kind == "urlset" else "sitemapindex"
+    else:
+        raise ValueError(f"不认识的订阅格式: {kind}")
+    return {"kind": kind, "entries": [e for e in entries if e["link"].startswith(("http://", "https://"))]}
@@ -0,0 +1,202 @@
+# 订阅源存储：feeds 记录每个订阅的条件请求头、高水位和下次轮询时间；feed_seen 记录已入队的条目
+import time
+import uuid
+import sqlite3
+from config import (
+    FEEDS_DB_PATH, FEED_DEFAULT_INTERVAL_MINUTES, FEED_MAX_ERROR_BACKOFF_MINUTES, FEED_SEEN_RETENTION_DAYS,
+)
+from utils.helpers import url_hash
+
+_FEED_COLUMNS = (
+    "feed_id", "user_id", "url", "folder", "interval_minutes", "backfill", "kind",
+    "etag", "last_modified", "high_water", "next_poll_at", "last_polled_at",
+    "last_new", "errors", "last_error", "created_at", "initialized",
+)
+
+
+def _connect():
+    conn = sqlite3.connect(FEEDS_DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def init_feeds_db():
+    conn = _connect()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feeds (
+            feed_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            url TEXT NOT NULL,
+            folder TEXT,
+            interval_minutes INTEGER NOT NULL,
+            backfill INTEGER NOT NULL,
+            kind TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            high_water TEXT,
+            next_poll_at REAL NOT NULL,
+            last_polled_at REAL,
+            last_new INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            initialized INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (user_id, url)
+        )
+        """
+    )
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(feeds)")}
+    if "initialized" not in columns:
+        # 老库：成功轮询过的订阅都写过 kind，以此补上新订阅标记
+        conn.execute("ALTER TABLE feeds ADD COLUMN initialized INTEGER NOT NULL DEFAULT 0")
+        conn.execute("UPDATE feeds SET initialized = 1 WHERE kind IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_feeds_next ON feeds (next_poll_at)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS feed_seen (
+            feed_id TEXT NOT NULL,
+            entry_key TEXT NOT NULL,
+            seen_at REAL NOT NULL,
+            PRIMARY KEY (feed_id, entry_key)
+        )
+        """
+    )
+    conn.commit()
+    conn.close()
+
+
+def _row_to_feed(row) -> dict:
+    return dict(zip(_FEED_COLUMNS, row))
+
+
+def add_feed(user_id: str, url: str, folder: str | None = None,
+             interval_minutes: int = FEED_DEFAULT_INTERVAL_MINUTES, backfill: int = 0) -> dict | None:
+    """同一用户重复订阅同一地址返回 None"""
+    feed_id = uuid.uuid4().hex[:12]
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO feeds (feed_id, user_id, url, folder, interval_minutes, backfill, next_poll_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (feed_id, user_id, url, folder, interval_minutes, backfill, now, now),
+        )
+        conn.commit()
+    except sqlite3.IntegrityError:
+        return None
+    finally:
+        conn.close()
+    return get_feed(feed_id)
+
+
+def get_feed(feed_id: str) -> dict | None:
+    conn = _connect()
+    row = conn.execute(f"SELECT {', '.join(_FEED_COLUMNS)} FROM feeds WHERE feed_id = ?", (feed_id,)).fetchone()
+    conn.close()
+    return _row_to_feed(row) if row else None
+
+
+def list_feeds(user_id: str) -> list[dict]:
+    conn = _connect()
+    rows = conn.execute(
+        f"SELECT {', '.join(_FEED_COLUMNS)} FROM feeds WHERE user_id = ? ORDER BY created_at", (user_id,)
+    ).fetchall()
+    conn.close()
+    return [_row_to_feed(r) for r in rows]
+
+
+def delete_feed(feed_id: str, user_id: str) -> bool:
+    conn = _connect()
+    deleted = conn.execute("DELETE FROM feeds WHERE feed_id = ? AND user_id = ?", (feed_id, user_id)).rowcount
+    conn.execute("DELETE FROM feed_seen WHERE feed_id = ?", (feed_id,))
+    conn.commit()
+    conn.close()
+    return bool(deleted)
+
+
+def due_feeds(limit: int = 20) -> list[dict]:
+    conn = _connect()
+    rows = conn.execute(
+        f"SELECT {', '.join(_FEED_COLUMNS)} FROM feeds WHERE next_poll_at <= ? ORDER BY next_poll_at LIMIT ?",
+        (time.time(), limit),
+    ).fetchall()
+    conn.close()
+    return [_row_to_feed(r) for r in rows]
+
+
+def unseen_entries(feed: dict, entries: list[dict]) -> list[dict]:
+    """
+    高水位之后的条目，或没有日期且没入过队的条目。
+    高水位只是快速过滤，真正防重复靠 feed_seen (有的源会修改旧文章的日期)。
+    """
+    hw = feed.get("high_water")
+    candidates = [e for e in entries if not hw or not e["published"] or e["published"] > hw]
+    if not candidates:
+        return []
+    conn = _connect()
+    seen = set()
+    keys = [url_hash(e["link"]) for e in candidates]
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        seen.update(r[0] for r in conn.execute(
+            f"SELECT entry_key FROM feed_seen WHERE feed_id = ? AND entry_key IN ({','.join('?' * len(chunk))})",
+            [feed["feed_id"], *chunk],
+        ))
+    conn.close()
+    return [e for e, key in zip(candidates, keys) if key not in seen]
+
+
+def mark_polled(feed: dict, *, kind: str | None, seen: list[dict], validators: dict | None, new_count: int):
+    """
+    轮询成功：记录已读条目、推进高水位、保存条件请求头，排下一次轮询，并把订阅标记为已初始化。
+    validators=None 表示沿用原来的 (304)；传 {} 会清空，下次强制完整拉取。
+    """
+    now = time.time()
+    dates = [e["published"] for e in seen if e["published"]]
+    high_water = max([feed.get("high_water") or "", *dates]) or None
+    if validators is None:
+        validators = {"etag": feed.get("etag"), "last_modified": feed.get("last_modified")}
+    conn = _connect()
+    conn.executemany(
+        "INSERT OR REPLACE INTO feed_seen (feed_id, entry_key, seen_at) VALUES (?, ?, ?)",
+        [(feed["feed_id"], url_hash(e["link"]), now) for e in seen],
+    )
+    conn.execute(
+        """
+        UPDATE feeds SET kind = COALESCE(?, kind), etag = ?, last_modified = ?,
+            high_water = ?, last_polled_at = ?, next_poll_at = ?, last_new = ?, errors = 0, last_error = NULL,
+            initialized = 1
+        WHERE feed_id = ?
+        """,
+        (kind, validators.get("etag"), validators.get("last_modified"), high_water, now,
+         now + feed["interval_minutes"] * 60, new_count, feed["feed_id"]),
+    )
+    conn.commit()
+    conn.close()
+
+
+def mark_failed(feed: dict, error: str, retry_in_minutes: float | None = None):
+    """
+    失败按 interval * 2^errors 退避；retry_in_minutes 用于排队满这类“稍后再试”的情况。
+    不动 initialized：首轮失败后重试仍按新订阅只回填 backfill 条。
+    """
+    now = time.time()
+    errors = feed.get("errors", 0) + 1
+    if retry_in_minutes is None:
+        retry_in_minutes = min(feed["interval_minutes"] * 2 ** (errors - 1), FEED_MAX_ERROR_BACKOFF_MINUTES)
+    conn = _connect()
+    conn.execute(
+        "UPDATE feeds SET errors = ?, last_error = ?, last_polled_at = ?, next_poll_at = ? WHERE feed_id = ?",
+        (errors, error[:500], now, now + retry_in_minutes * 60, feed["feed_id"]),
+    )
+    conn.commit()
+    conn.close()
+
+
+def purge_seen(retention_days: int = FEED_SEEN_RETENTION_DAYS) -> int:
+    conn = _connect()
+    removed = conn.execute("DELETE FROM feed_seen WHERE seen_at < ?", (time.time() - retention_days * 86400,)).rowcount
+    conn.commit()
+    conn.close()
+    return removed
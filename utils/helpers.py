@@ -2,6 +2,11 @@ import re
 import hashlib
 from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
+URL_PATTERN = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[^\s]*'
+
+def find_urls(text: str) -> list[str]:
+    return re.findall(URL_PATTERN, text)
+
 def sanitize_filename(title: str) -> str:
     return re.sub(r'[\\/*?:"<>|]', "", title).strip()
 
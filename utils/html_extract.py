@@ -0,0 +1,178 @@
+# 网页正文抽取 (模块级函数，丢进 cpu 进程池跑，不占事件循环)
+# 按域名注册专用抽取器 (直接取已知 DOM 节点)，取不到再交给 trafilatura 通用启发式
+import re
+import time
+from urllib.parse import urlsplit, urljoin
+
+EXTRACTORS: list[tuple[str, tuple[str, ...], object]] = []   # (名字, 域名后缀, 函数)
+MIN_FAST_PATH_CHARS = 100   # 专用抽取器拿到的正文太短就认为页面结构变了，走通用抽取
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCKS = {"p", "div", "section", "article", "blockquote", "figure", "figcaption", "ul", "ol", "table", "tr", "hr"}
+_SKIP = {"script", "style", "noscript", "iframe", "svg", "button", "form"}
+
+
+def register_extractor(name: str, domains: tuple[str, ...]):
+    """装饰器：fn(tree, url) -> {"text", "title", "author", "sitename"} 或 None"""
+    def deco(fn):
+        EXTRACTORS.append((name, domains, fn))
+        return fn
+    return deco
+
+
+def _match_extractor(url: str):
+    host = (urlsplit(url).hostname or "").lower()
+    for name, domains, fn in EXTRACTORS:
+        if any(host == d or host.endswith("." + d) for d in domains):
+            return name, fn
+    return None, None
+
+
+def _has_class(cls: str) -> str:
+    return f'contains(concat(" ", normalize-space(@class), " "), " {cls} ")'
+
+
+def _by_class(tree, cls: str, tag: str = "*") -> list:
+    return tree.xpath(f'//{tag}[{_has_class(cls)}]')
+
+
+def _first_text(tree, xpaths: list[str]) -> str:
+    for xp in xpaths:
+        for node in tree.xpath(xp):
+            text = (node if isinstance(node, str) else node.text_content()).strip()
+            if text:
+                return text
+    return ""
+
+
+def _to_markdown(node, base_url: str = "") -> str:
+    """把已知正文节点转成 markdown (段落/标题/列表/图片/链接/代码块)，够用即可"""
+    parts: list[str] = []
+
+    def walk(el):
+        tag = el.tag.lower() if isinstance(el.tag, str) else ""
+        if tag in _SKIP or not tag:
+            if el.tail:
+                parts.append(el.tail)
+            return
+        if tag == "img":
+            src = el.get("data-src") or el.get("data-original") or el.get("data-actualsrc") or el.get("src")
+            if src and not src.startswith("data:"):
+                parts.append(f"\n\n![]({urljoin(base_url, src)})\n\n")
+        elif tag == "br":
+            parts.append("\n")
+        elif tag in _HEADINGS:
+            parts.append(f"\n\n{'#' * _HEADINGS[tag]} {el.text_content().strip()}\n\n")
+        elif tag == "pre":
+            parts.append(f"\n\n```\n{el.text_content().rstrip()}\n```\n\n")
+        elif tag == "a":
+            text = el.text_content().strip()
+            href = el.get("href")
+            parts.append(f"[{text}]({urljoin(base_url, href)})" if text and href and not href.startswith("javascript:") else text)
+        else:
+            prefix, suffix = "", ""
+            # 公众号里很多空的 <strong>，不加标记
+            inline = el.text_content().strip() if tag in ("strong", "b", "em", "i", "code") else ""
+            if tag in ("strong", "b") and inline:
+                prefix = suffix = "**"
+            elif tag in ("em", "i") and inline:
+                prefix = suffix = "*"
+            elif tag == "code" and inline:
+                prefix = suffix = "`"
+            elif tag == "li":
+                prefix, suffix = "\n- ", "\n"
+            elif tag == "blockquote":
+                prefix, suffix = "\n\n> ", "\n\n"
+            elif tag in _BLOCKS:
+                prefix = suffix = "\n\n"
+            parts.append(prefix)
+            if el.text:
+                parts.append(el.text)
+            for child in el:
+                walk(child)
+            parts.append(suffix)
+        if el.tail:
+            parts.append(el.tail)
+
+    walk(node)
+    text = "".join(parts).replace("\xa0", " ")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+@register_extractor("zhihu", ("zhihu.com",))
+def _extract_zhihu(tree, url: str) -> dict | None:
+    # 专栏文章 .Post-RichText；问答页取第一个回答 (回答链接打开时就是目标回答)。
+    # 问题描述 (.QuestionRichText) 也是 .RichText 且排在回答前面，只能在回答容器里找
+    nodes = (
+        _by_class(tree, "Post-RichText")
+        or tree.xpath(f'//*[{_has_class("AnswerItem")}]//*[{_has_class("RichText")}]')
+        or tree.xpath(f'//*[{_has_class("RichContent-inner")}]//*[{_has_class("RichText")}]')
+    )
+    if not nodes:
+        return None
+    return {
+        "text": _to_markdown(nodes[0], url),
+        "title": _first_text(tree, ['//h1[contains(@class, "Post-Title")]', '//h1[contains(@class, "QuestionHeader-title")]',
+                                    '//meta[@property="og:title"]/@content', "//title"]),
+        "author": _first_text(tree, ['//meta[@itemprop="name"]/@content', '//*[contains(@class, "AuthorInfo-name")]',
+                                     '//*[contains(@class, "UserLink")]', '//meta[@name="author"]/@content']),
+        "sitename": "知乎",
+    }
+
+
+@register_extractor("weixin", ("mp.weixin.qq.com",))
+def _extract_weixin(tree, url: str) -> dict | None:
+    nodes = tree.xpath('//*[@id="js_content"]')
+    if not nodes:
+        return None
+    return {
+        "text": _to_markdown(nodes[0], url),
+        "title": _first_text(tree, ['//*[@id="activity-name"]', '//meta[@property="og:title"]/@content', "//title"]),
+        "author": _first_text(tree, ['//*[@id="js_author_name"]', '//meta[@name="author"]/@content']),
+        "sitename": _first_text(tree, ['//*[@id="js_name"]']) or "微信公众平台",
+    }
+
+
+def _extract_generic(tree) -> dict:
+    import trafilatura
+    # extract 会清洗树，元数据要先取
+    meta = trafilatura.extract_metadata(tree)
+    text = trafilatura.extract(tree, output_format="markdown", include_images=True,
+                               include_formatting=True, include_links=True)
+    return {
+        "text": text or "",
+        "title": meta.title if meta else None,
+        "author": meta.author if meta else "",
+        "sitename": meta.sitename if meta else "",
+    }
+
+
+def extract_article(html: str, url: str = "") -> dict | None:
+    """
+    只解析一次：建好 lxml 树后先试域名专用抽取器，不行再用 trafilatura。
+    大小上限 (HTML_EXTRACT_MAX_BYTES) 由调用方在送进进程池之前检查，免得白白 pickle 大页面。
+    返回里带 extractor / seconds，进程池里没法直接记指标，由调用方在主进程记录。
+    """
+    from trafilatura.utils import load_html
+
+    t0 = time.perf_counter()
+    tree = load_html(html)
+    if tree is None:
+        return None
+
+    name, fn = _match_extractor(url)
+    fallback_from = None
+    if fn:
+        try:
+            result = fn(tree, url)
+        except Exception as e:
+            print(f"⚠️ 抽取器 {name} 出错，改用通用抽取: {e}")
+            result = None
+        if result and len(result["text"]) >= MIN_FAST_PATH_CHARS:
+            return {**result, "extractor": name, "fallback_from": None, "seconds": time.perf_counter() - t0}
+        fallback_from = name
+
+    result = _extract_generic(tree)
+    return {**result, "extractor": "trafilatura", "fallback_from": fallback_from, "seconds": time.perf_counter() - t0}
@@ -0,0 +1,57 @@
+# 共享 HTTP 客户端：按 profile 复用连接 (TCP/TLS 握手、Cookie)，应用退出时统一关闭
+import asyncio
+import threading
+import importlib.util
+import httpx
+from config import HTTP_CLIENT_PROFILES
+
+_HAS_H2 = importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+_async_clients: dict[tuple, tuple] = {}   # (profile, id(loop)) -> (loop, AsyncClient)
+
+
+def _client_kwargs(profile: str) -> dict:
+    cfg = HTTP_CLIENT_PROFILES[profile]
+    return {
+        "timeout": cfg.get("timeout", 30.0),
+        "verify": cfg.get("verify", True),
+        "follow_redirects": cfg.get("follow_redirects", False),
+        "http2": bool(cfg.get("http2")) and _HAS_H2,
+        "limits": httpx.Limits(
+            max_connections=cfg.get("max_connections", 16),
+            max_keepalive_connections=cfg.get("max_keepalive", 8),
+            keepalive_expiry=cfg.get("keepalive_expiry", 30.0),
+        ),
+    }
+
+
+def get_async_client(profile: str) -> httpx.AsyncClient:
+    """
+    当前事件循环上的共享 AsyncClient，按 (profile, 事件循环) 各建一个。
+    AsyncClient 的连接池绑定创建它的事件循环；用完一个循环 (例如脚本里的 asyncio.run)
+    要在循环结束前 await close_clients()，否则连接池会泄漏。
+    """
+    loop = asyncio.get_running_loop()
+    key = (profile, id(loop))
+    with _lock:
+        for stale_key, (stale_loop, client) in list(_async_clients.items()):
+            if stale_loop.is_closed():
+                # 循环已关闭，没法再 aclose；只能丢掉引用 (应在循环结束前 close_clients)
+                print(f"⚠️ HTTP 客户端 {stale_key[0]} 所在事件循环已关闭但未 close_clients")
+                del _async_clients[stale_key]
+        entry = _async_clients.get(key)
+        if entry is None or entry[0] is not loop or entry[1].is_closed:
+            entry = (loop, httpx.AsyncClient(**_client_kwargs(profile)))
+            _async_clients[key] = entry
+        return entry[1]
+
+
+async def close_clients():
+    """关闭当前事件循环上的所有共享客户端"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        mine = [key for key, (client_loop, _) in _async_clients.items() if client_loop is loop]
+        clients = [_async_clients.pop(key)[1] for key in mine]
+    for client in clients:
+        await client.aclose()
@@ -5,11 +5,11 @@ import os
 import time
 from typing import Any
 
-import httpx
 from PIL import Image, ExifTags
 
 from config import VLM_API_URL, VLM_MODEL, IMAGE_OCR_ARTICLE_THRESHOLD
 from utils.helpers import sanitize_filename
+from core.llm import complete_sync, message_text
 
 
 def _extract_exif(path: str) -> dict[str, Any]:
@@ -60,29 +60,25 @@ def _call_vlm(image_path: str) -> dict[str, Any]:
         "要求：只输出 JSON，不要加任何解释。"
     )
 
-    payload = {
-        "model": VLM_MODEL,
-        "messages": [
-            {"role": "system", "content": "你是一个严谨的多模态图像分析助手。"},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{b64}"},
-                    },
-                ],
-            },
-        ],
-        "temperature": 0.2,
-        "max_tokens": 800,
-    }
+    messages = [
+        {"role": "system", "content": "你是一个严谨的多模态图像分析助手。"},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{b64}"},
+                },
+            ],
+        },
+    ]
 
-    resp = httpx.post(VLM_API_URL, json=payload, timeout=120)
-    resp.raise_for_status()
-    data = resp.json()
-    content = data["choices"][0]["message"]["content"].strip()
+    data = complete_sync(
+        messages, caller="vlm", priority="ingest", temperature=0.2, max_tokens=800,
+        timeout=120, model=VLM_MODEL, url=VLM_API_URL,
+    )
+    content = message_text(data).strip()
 
     return _safe_json(content)
 
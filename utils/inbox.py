@@ -1,25 +1,46 @@
+# 兼容层：任务已迁移到 SQLite 队列 (utils.job_queue)，这里保留旧接口
 import os
 import json
-from config import INBOX_DIR, DATA_DIR
+from config import INBOX_DIR
+from utils import job_queue
+
+def _job_id_from_ref(job_ref: str) -> str:
+    """兼容旧调用方传入的文件路径 (data/inbox/<job_id>.json)"""
+    base = os.path.basename(job_ref)
+    for suffix in (".running", ".json"):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return base
 
 def write_inbox_job(job: dict) -> str:
-    job_id = job["job_id"]
-    path = os.path.join(INBOX_DIR, f"{job_id}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(job, f, ensure_ascii=False, indent=2)
-    return path
+    job_queue.enqueue(job)
+    return job["job_id"]
+
+def list_inbox_job_ids() -> list[str]:
+    """返回排队中的 job_id (按入队顺序)"""
+    return job_queue.list_queued()
 
 def list_inbox_jobs() -> list[str]:
-    files = []
-    if not os.path.exists(INBOX_DIR): return []
-    for fn in os.listdir(INBOX_DIR):
-        if fn.endswith(".json"):
-            files.append(os.path.join(INBOX_DIR, fn))
-    files.sort(key=lambda p: os.path.getmtime(p))
-    return files
+    """旧接口：返回 data/inbox/<job_id>.json 形式的任务引用 (按入队顺序)，可直接传给 mark_inbox_done"""
+    return [os.path.join(INBOX_DIR, f"{job_id}.json") for job_id in list_inbox_job_ids()]
+
+def mark_inbox_done(job_ref: str):
+    job_queue.ack(_job_id_from_ref(job_ref))
 
-def mark_inbox_done(job_path: str):
-    done_dir = os.path.join(DATA_DIR, "done")
-    os.makedirs(done_dir, exist_ok=True)
-    base = os.path.basename(job_path)
-    os.rename(job_path, os.path.join(done_dir, base))
\ No newline at end of file
+def import_legacy_inbox() -> int:
+    """把旧版 data/inbox 目录里遗留的 JSON 任务导入队列"""
+    if not os.path.exists(INBOX_DIR): return 0
+    count = 0
+    for fn in sorted(os.listdir(INBOX_DIR), key=lambda n: os.path.getmtime(os.path.join(INBOX_DIR, n))):
+        if not fn.endswith((".json", ".json.running")):
+            continue
+        path = os.path.join(INBOX_DIR, fn)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                job = json.load(f)
+            job_queue.enqueue(job)
+            os.remove(path)
+            count += 1
+        except Exception as e:
+            print(f"⚠️ 旧任务导入失败 {fn}: {e}")
+    return count
@@ -0,0 +1,498 @@
+# 分段任务日志：data/jobs/jobs-YYYY-MM-DD.jsonl + SQLite 索引 (job_id -> 分段, 偏移)
+import os
+import json
+import time
+import base64
+import sqlite3
+import datetime
+import threading
+from config import (
+    JOBS_LOG_PATH, JOBS_LOG_DIR, JOBS_INDEX_DB_PATH,
+    JOB_LOG_COMPACT_AFTER_DAYS, JOB_LOG_RETENTION_DAYS,
+)
+
+SEGMENT_PREFIX = "jobs-"
+SEGMENT_SUFFIX = ".jsonl"
+TERMINAL_PREFIXES = ("SUCCESS", "FAILED")
+
+_append_lock = threading.Lock()
+
+
+def is_terminal(status: str) -> bool:
+    return (status or "").startswith(TERMINAL_PREFIXES)
+
+
+def _connect():
+    conn = sqlite3.connect(JOBS_INDEX_DB_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def init_index_db():
+    os.makedirs(JOBS_LOG_DIR, exist_ok=True)
+    conn = _connect()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_events (
+            job_id TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            status TEXT,
+            step TEXT,
+            segment TEXT NOT NULL,
+            offset INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id, ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_ts ON job_events (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_segment ON job_events (segment)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS segments (
+            name TEXT PRIMARY KEY,
+            day TEXT NOT NULL,
+            compacted INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # 每个 job 一行汇总 + 每个阶段累计耗时，供 /api/jobs 过滤分页 (不受分段压缩影响)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_summary (
+            job_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            source TEXT,
+            status TEXT,
+            step TEXT,
+            url TEXT,
+            error TEXT,
+            first_ts TEXT NOT NULL,
+            last_ts TEXT NOT NULL,
+            step_ts TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    for col in ("user_id", "status", "source"):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_job_summary_{col} ON job_summary ({col}, last_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_summary_last ON job_summary (last_ts)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_stages (
+            job_id TEXT NOT NULL,
+            step TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_id, step)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_stages_step ON job_stages (step, started_at)")
+    conn.commit()
+    need_backfill = (
+        conn.execute("SELECT 1 FROM job_summary LIMIT 1").fetchone() is None
+        and conn.execute("SELECT 1 FROM job_events LIMIT 1").fetchone() is not None
+    )
+    conn.close()
+    if need_backfill:
+        print(f"🧮 已从分段日志回填任务汇总: {rebuild_summaries()} 个任务")
+
+
+def segment_name(ts: str) -> str:
+    """ts 形如 2025-12-22T13:14:16，取日期部分"""
+    day = (ts or "")[:10] or time.strftime("%Y-%m-%d")
+    return f"{SEGMENT_PREFIX}{day}{SEGMENT_SUFFIX}"
+
+
+def segment_path(name: str) -> str:
+    return os.path.join(JOBS_LOG_DIR, name)
+
+
+def list_segments() -> list[str]:
+    """按日期升序"""
+    if not os.path.exists(JOBS_LOG_DIR):
+        return []
+    return sorted(
+        fn for fn in os.listdir(JOBS_LOG_DIR)
+        if fn.startswith(SEGMENT_PREFIX) and fn.endswith(SEGMENT_SUFFIX)
+    )
+
+
+def append_records(records: list[dict], sync: bool = True):
+    """追加写入对应日期的分段，并记录索引 (一批一个事务)"""
+    by_segment: dict[str, list[dict]] = {}
+    for rec in records:
+        by_segment.setdefault(segment_name(rec.get("ts", "")), []).append(rec)
+
+    rows = []
+    with _append_lock:
+        for name, recs in by_segment.items():
+            with open(segment_path(name), "ab") as f:
+                offset = f.tell()
+                for rec in recs:
+                    data = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                    f.write(data)
+                    rows.append((rec.get("job_id", ""), rec.get("ts", ""), rec.get("status", ""),
+                                 rec.get("step", ""), name, offset))
+                    offset += len(data)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+        conn = _connect()
+        conn.executemany(
+            "INSERT OR IGNORE INTO segments (name, day) VALUES (?, ?)",
+            [(name, name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in by_segment],
+        )
+        conn.executemany(
+            "INSERT INTO job_events (job_id, ts, status, step, segment, offset) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        _update_summaries(conn, records)
+        conn.commit()
+        conn.close()
+
+
+def _parse_ts(ts: str) -> datetime.datetime | None:
+    try:
+        return datetime.datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return None
+
+
+def _update_summaries(conn, records: list[dict]):
+    """
+    按事件顺序推进每个 job 的汇总：上一步从 step_ts 持续到本条事件的 ts，
+    累加进 job_stages。与事件索引同一个事务提交。
+    """
+    summaries: dict[str, dict] = {}
+    stage_rows = []
+    for rec in records:
+        job_id = rec.get("job_id")
+        ts = rec.get("ts")
+        if not job_id or not ts:
+            continue
+        cur = summaries.get(job_id)
+        if cur is None:
+            row = conn.execute(
+                "SELECT user_id, source, status, step, url, error, first_ts, last_ts, step_ts, events "
+                "FROM job_summary WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+            cur = dict(zip(("user_id", "source", "status", "step", "url", "error",
+                            "first_ts", "last_ts", "step_ts", "events"), row)) if row else None
+
+        step = rec.get("step") or ""
+        if cur is None:
+            cur = {"user_id": None, "source": None, "status": None, "step": "", "url": None,
+                   "error": None, "first_ts": ts, "last_ts": ts, "step_ts": ts, "events": 0}
+        elif step and step != cur["step"]:
+            # 终态之后的事件 (手动重试) 不把等待时间算进上一步
+            start, end = _parse_ts(cur["step_ts"]), _parse_ts(ts)
+            if cur["step"] and start and end and not is_terminal(cur["status"] or ""):
+                stage_rows.append((job_id, cur["step"], cur["step_ts"], max((end - start).total_seconds(), 0)))
+            cur["step_ts"] = ts
+
+        extra = rec.get("extra") or {}
+        cur["user_id"] = cur["user_id"] or rec.get("user_id") or None
+        cur["source"] = cur["source"] or extra.get("source")
+        cur["url"] = rec.get("url") or cur["url"]
+        cur["status"] = rec.get("status") or cur["status"]
+        cur["error"] = rec.get("error") if cur["status"] in ("FAILED", "RETRYING") else None
+        if step and step != cur["step"]:
+            stage_rows.append((job_id, step, ts, 0.0))
+            cur["step"] = step
+        cur["last_ts"] = max(cur["last_ts"], ts)
+        cur["events"] += 1
+        summaries[job_id] = cur
+
+    conn.executemany(
+        """
+        INSERT INTO job_stages (job_id, step, started_at, seconds) VALUES (?, ?, ?, ?)
+        ON CONFLICT(job_id, step) DO UPDATE SET seconds = seconds + excluded.seconds
+        """,
+        stage_rows,
+    )
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO job_summary
+            (job_id, user_id, source, status, step, url, error, first_ts, last_ts, step_ts, events)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [
+            (job_id, c["user_id"], c["source"], c["status"], c["step"], c["url"], c["error"],
+             c["first_ts"], c["last_ts"], c["step_ts"], c["events"])
+            for job_id, c in summaries.items()
+        ],
+    )
+
+
+def rebuild_summaries() -> int:
+    """老索引升级：按时间顺序重放现有分段 (已压缩分段只剩终态，阶段耗时会缺失)"""
+    conn = _connect()
+    conn.execute("DELETE FROM job_summary")
+    conn.execute("DELETE FROM job_stages")
+    for name in list_segments():
+        batch = []
+        with open(segment_path(name), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    batch.append(json.loads(line))
+                except Exception:
+                    continue
+                if len(batch) >= 5000:
+                    _update_summaries(conn, batch)
+                    batch = []
+        _update_summaries(conn, batch)
+    conn.commit()
+    total = conn.execute("SELECT COUNT(*) FROM job_summary").fetchone()[0]
+    conn.close()
+    return total
+
+
+def encode_cursor(last_ts: str, job_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{last_ts}|{job_id}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    last_ts, job_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    return last_ts, job_id
+
+
+def query_jobs(*, user_id: str | None = None, status: list[str] | None = None, source: str | None = None,
+               step: str | None = None, since: str | None = None, until: str | None = None,
+               cursor: str | None = None, limit: int = 50) -> dict:
+    """
+    按最后活动时间倒序分页查询任务汇总。
+    step 匹配“经过了这个阶段”的任务 (例如 crawl_jina 看 Jina 兜底量)。
+    cursor 为上一页返回的 next_cursor (keyset 分页，翻页代价与页码无关)。
+    """
+    where, args = [], []
+    if user_id:
+        where.append("s.user_id = ?")
+        args.append(user_id)
+    if status:
+        where.append(f"s.status IN ({','.join('?' * len(status))})")
+        args.extend(status)
+    if source:
+        where.append("s.source = ?")
+        args.append(source)
+    if step:
+        where.append("s.job_id IN (SELECT job_id FROM job_stages WHERE step = ?)")
+        args.append(step)
+    if since:
+        where.append("s.last_ts >= ?")
+        args.append(since)
+    if until:
+        where.append("s.last_ts < ?")
+        args.append(until)
+    if cursor:
+        c_ts, c_job = decode_cursor(cursor)
+        where.append("(s.last_ts < ? OR (s.last_ts = ? AND s.job_id < ?))")
+        args.extend([c_ts, c_ts, c_job])
+
+    sql = (
+        "SELECT s.job_id, s.user_id, s.source, s.status, s.step, s.url, s.error, s.first_ts, s.last_ts, s.events "
+        "FROM job_summary s"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + " ORDER BY s.last_ts DESC, s.job_id DESC LIMIT ?"
+    )
+    conn = _connect()
+    rows = conn.execute(sql, args + [limit + 1]).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    stages: dict[str, dict] = {}
+    if rows:
+        ids = [r[0] for r in rows]
+        for job_id, stage, seconds in conn.execute(
+            f"SELECT job_id, step, seconds FROM job_stages WHERE job_id IN ({','.join('?' * len(ids))}) "
+            "ORDER BY started_at",
+            ids,
+        ):
+            stages.setdefault(job_id, {})[stage] = round(seconds, 3)
+    conn.close()
+
+    jobs = []
+    for job_id, uid, src, st, stp, url, err, first_ts, last_ts, events in rows:
+        start, end = _parse_ts(first_ts), _parse_ts(last_ts)
+        jobs.append({
+            "job_id": job_id,
+            "user_id": uid,
+            "source": src,
+            "status": st,
+            "step": stp,
+            "url": url,
+            "error": err,
+            "first_ts": first_ts,
+            "last_ts": last_ts,
+            "events": events,
+            "duration": (end - start).total_seconds() if start and end else None,
+            "stages": stages.get(job_id, {}),
+        })
+    next_cursor = encode_cursor(rows[-1][8], rows[-1][0]) if has_more else None
+    return {"jobs": jobs, "next_cursor": next_cursor}
+
+
+def read_record(segment: str, offset: int) -> dict | None:
+    try:
+        with open(segment_path(segment), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+    except Exception:
+        return None
+
+
+def latest_record(job_id: str) -> dict | None:
+    """通过索引直接定位某个 job 的最后一条事件"""
+    conn = _connect()
+    row = conn.execute(
+        "SELECT segment, offset FROM job_events WHERE job_id = ? ORDER BY ts DESC, rowid DESC LIMIT 1",
+        (job_id,),
+    ).fetchone()
+    conn.close()
+    return read_record(row[0], row[1]) if row else None
+
+
+def iter_tail_records(max_bytes: int):
+    """从最新的分段往前取，总量不超过 max_bytes，按时间正序返回 (用于重建状态索引)"""
+    chunks = []
+    budget = max_bytes
+    for name in reversed(list_segments()):
+        if budget <= 0:
+            break
+        path = segment_path(name)
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(size - budget, 0)
+            f.seek(start)
+            if start:
+                f.readline()  # 丢掉被截断的半行
+            chunks.append(f.read())
+        budget -= size
+    for chunk in reversed(chunks):
+        for line in chunk.splitlines():
+            try:
+                yield json.loads(line)
+            except Exception:
+                continue
+
+
+def tail_records(limit: int) -> list[dict]:
+    """最近 limit 条事件，新的在前 (系统日志页面用)"""
+    out = []
+    for name in reversed(list_segments()):
+        with open(segment_path(name), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        for line in reversed(lines):
+            if not line.strip():
+                continue
+            try:
+                out.append(json.loads(line))
+            except Exception:
+                out.append({"raw": line})
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def compact_segments(older_than_days: int = JOB_LOG_COMPACT_AFTER_DAYS) -> int:
+    """
+    压缩旧分段：每个 job 只保留终态事件；没有终态的保留最后一条，避免丢失。
+    返回被压缩的分段数。
+    """
+    cutoff = (datetime.date.today() - datetime.timedelta(days=older_than_days)).isoformat()
+    conn = _connect()
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM segments WHERE compacted = 0 AND day < ?", (cutoff,)
+    ).fetchall()]
+    conn.close()
+
+    compacted = 0
+    for name in names:
+        path = segment_path(name)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except Exception:
+                    continue
+        last_index = {rec.get("job_id"): i for i, rec in enumerate(records)}
+        kept = [rec for i, rec in enumerate(records)
+                if is_terminal(rec.get("status", "")) or last_index.get(rec.get("job_id")) == i]
+
+        tmp_path = path + ".tmp"
+        rows = []
+        with open(tmp_path, "wb") as f:
+            offset = 0
+            for rec in kept:
+                data = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                f.write(data)
+                rows.append((rec.get("job_id", ""), rec.get("ts", ""), rec.get("status", ""),
+                             rec.get("step", ""), name, offset))
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with _append_lock:
+            os.replace(tmp_path, path)
+            conn = _connect()
+            conn.execute("DELETE FROM job_events WHERE segment = ?", (name,))
+            conn.executemany(
+                "INSERT INTO job_events (job_id, ts, status, step, segment, offset) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("UPDATE segments SET compacted = 1 WHERE name = ?", (name,))
+            conn.commit()
+            conn.close()
+        compacted += 1
+        print(f"🗜️ 日志分段已压缩: {name} {len(records)} -> {len(kept)} 条")
+    return compacted
+
+
+def purge_segments(retention_days: int = JOB_LOG_RETENTION_DAYS) -> int:
+    cutoff = (datetime.date.today() - datetime.timedelta(days=retention_days)).isoformat()
+    conn = _connect()
+    names = [r[0] for r in conn.execute("SELECT name FROM segments WHERE day < ?", (cutoff,)).fetchall()]
+    for name in names:
+        with _append_lock:
+            try:
+                os.remove(segment_path(name))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM job_events WHERE segment = ?", (name,))
+            conn.execute("DELETE FROM segments WHERE name = ?", (name,))
+            conn.commit()
+    if names:
+        conn.execute(
+            "DELETE FROM job_stages WHERE job_id IN (SELECT job_id FROM job_summary WHERE last_ts < ?)", (cutoff,)
+        )
+        conn.execute("DELETE FROM job_summary WHERE last_ts < ?", (cutoff,))
+        conn.commit()
+    conn.close()
+    return len(names)
+
+
+def migrate_legacy_log() -> int:
+    """把旧版 data/jobs.jsonl 按天拆进分段并建索引，完成后改名为 .migrated"""
+    if not os.path.exists(JOBS_LOG_PATH):
+        return 0
+    batch, total = [], 0
+    with open(JOBS_LOG_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                batch.append(json.loads(line))
+            except Exception:
+                continue
+            if len(batch) >= 5000:
+                append_records(batch, sync=False)
+                total += len(batch)
+                batch = []
+    if batch:
+        append_records(batch, sync=True)
+        total += len(batch)
+    os.replace(JOBS_LOG_PATH, JOBS_LOG_PATH + ".migrated")
+    return total
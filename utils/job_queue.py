@@ -0,0 +1,441 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+from config import (
+    QUEUE_DB_PATH, QUEUE_VISIBILITY_TIMEOUT, QUEUE_DONE_RETENTION_DAYS,
+    QUEUE_PRIORITY_INTERACTIVE, QUEUE_PRIORITY_BULK, QUEUE_INTERACTIVE_SOURCES, QUEUE_PRIORITY_AGING,
+    QUEUE_MAX_ATTEMPTS, QUEUE_RETRY_BASE_DELAY, QUEUE_RETRY_MAX_DELAY,
+)
+
+# 状态: queued -> running -> done
+#                        \-> queued (退避后重试) -> ... -> dead (死信，需手动 requeue)
+# running 超过 claimed_until 未续约的任务会被重新认领 (visibility timeout)
+# 各阶段产物 (抓取结果 / AI 分析) 存在 job_checkpoints，重试时从失败的阶段继续
+# 调度顺序: enqueued_at + priority * QUEUE_PRIORITY_AGING 最小者优先，
+# 低优先级任务等得足够久后会排到新来的高优先级任务前面，不会饿死
+_ORDER_BY = f"enqueued_at + priority * {QUEUE_PRIORITY_AGING}"
+
+PRIORITY_NAMES = {
+    "interactive": QUEUE_PRIORITY_INTERACTIVE,
+    "bulk": QUEUE_PRIORITY_BULK,
+}
+
+_wakeup: asyncio.Event | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _connect():
+    conn = sqlite3.connect(QUEUE_DB_PATH, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def init_queue_db():
+    os.makedirs(os.path.dirname(QUEUE_DB_PATH), exist_ok=True)
+    conn = _connect()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_queue (
+            job_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            source TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            enqueued_at REAL NOT NULL,
+            claimed_until REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            finished_at REAL,
+            error TEXT,
+            priority INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(job_queue)")}
+    if "priority" not in columns:
+        conn.execute(f"ALTER TABLE job_queue ADD COLUMN priority INTEGER NOT NULL DEFAULT {QUEUE_PRIORITY_INTERACTIVE}")
+    if "available_at" not in columns:
+        conn.execute("ALTER TABLE job_queue ADD COLUMN available_at REAL NOT NULL DEFAULT 0")
+    if "batch_id" not in columns:
+        conn.execute("ALTER TABLE job_queue ADD COLUMN batch_id TEXT")
+    if "dedupe_key" not in columns:
+        conn.execute("ALTER TABLE job_queue ADD COLUMN dedupe_key TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_status ON job_queue (status, enqueued_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_batch ON job_queue (batch_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_job_queue_dedupe ON job_queue (dedupe_key, status)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_checkpoints (
+            job_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (job_id, stage)
+        )
+        """
+    )
+    conn.close()
+
+
+def priority_for(job: dict) -> int:
+    """job 里显式指定 priority ("interactive"/"bulk") 优先，否则按来源判断"""
+    explicit = job.get("priority")
+    if explicit in PRIORITY_NAMES:
+        return PRIORITY_NAMES[explicit]
+    if job.get("source") in QUEUE_INTERACTIVE_SOURCES:
+        return QUEUE_PRIORITY_INTERACTIVE
+    return QUEUE_PRIORITY_BULK
+
+
+def bind_loop():
+    """在事件循环里调用一次，之后 enqueue 可以立即唤醒等待中的 worker"""
+    global _wakeup, _loop
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+
+
+def _notify():
+    if _loop is None or _wakeup is None:
+        return
+    try:
+        _loop.call_soon_threadsafe(_wakeup.set)
+    except RuntimeError:
+        pass
+
+
+def reset_wakeup():
+    """claim 之前调用：先清信号再查队列，这之后的 enqueue 一定会让 wait_for_job 立即返回"""
+    if _wakeup is not None:
+        _wakeup.clear()
+
+
+async def wait_for_job(timeout: float):
+    """等待新任务信号，超时也返回 (兜底轮询)；信号由下一轮 claim 前的 reset_wakeup 清掉"""
+    if _wakeup is None:
+        await asyncio.sleep(timeout)
+        return
+    try:
+        await asyncio.wait_for(_wakeup.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+_INSERT_SQL = (
+    "INSERT OR IGNORE INTO job_queue "
+    "(job_id, user_id, source, payload, status, enqueued_at, priority, batch_id, dedupe_key) "
+    "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)"
+)
+
+
+def _insert_row(job: dict, now: float) -> tuple:
+    return (job["job_id"], job.get("user_id", ""), job.get("source", ""),
+            json.dumps(job, ensure_ascii=False), now, priority_for(job),
+            job.get("batch_id"), job.get("dedupe_key"))
+
+
+def enqueue(job: dict):
+    conn = _connect()
+    conn.execute(_INSERT_SQL, _insert_row(job, time.time()))
+    conn.close()
+    _notify()
+
+
+def _split_duplicates(conn, jobs: list[dict]) -> tuple[list[dict], list[dict]]:
+    """带 dedupe_key 的任务：批内重复、或同一用户已有 queued/running 的同 key 任务都算重复"""
+    fresh, duplicates = [], []
+    seen = set()
+    for job in jobs:
+        key = job.get("dedupe_key")
+        if key:
+            scoped = (job.get("user_id", ""), key)
+            active = conn.execute(
+                "SELECT 1 FROM job_queue WHERE dedupe_key = ? AND user_id = ? "
+                "AND status IN ('queued', 'running') LIMIT 1",
+                (key, job.get("user_id", "")),
+            ).fetchone()
+            if scoped in seen or active:
+                duplicates.append(job)
+                continue
+            seen.add(scoped)
+        fresh.append(job)
+    return fresh, duplicates
+
+
+def filter_duplicates(jobs: list[dict]) -> tuple[list[dict], list[dict]]:
+    """只查不写：返回 (会入队的, 会被去重的)，入队前按去重后的条数做准入检查"""
+    conn = _connect()
+    try:
+        return _split_duplicates(conn, jobs)
+    finally:
+        conn.close()
+
+
+def enqueue_many(jobs: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    单事务批量入队。带 dedupe_key 的任务会去重：批内重复、或同一用户已有
+    queued/running 的同 key 任务都跳过。返回 (入队的, 被去重的)。
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        accepted, duplicates = _split_duplicates(conn, jobs)
+        conn.executemany(_INSERT_SQL, [_insert_row(job, now) for job in accepted])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    if accepted:
+        _notify()
+    return accepted, duplicates
+
+
+def batch_progress(batch_id: str, user_id: str | None = None) -> dict:
+    """批次进度；传 user_id 时只统计该用户的任务 (别人的批次 total 为 0)"""
+    conn = _connect()
+    if user_id is None:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) FROM job_queue WHERE batch_id = ? GROUP BY status", (batch_id,)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) FROM job_queue WHERE batch_id = ? AND user_id = ? GROUP BY status",
+            (batch_id, user_id),
+        ).fetchall()
+    conn.close()
+    counts = {status: n for status, n in rows}
+    total = sum(counts.values())
+    finished = counts.get("done", 0) + counts.get("dead", 0)
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "queued": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "done": counts.get("done", 0),
+        "dead": counts.get("dead", 0),
+        "progress": round(finished / total, 4) if total else 0.0,
+    }
+
+
+def claim(max_priority: int | None = None) -> dict | None:
+    """
+    原子认领一个任务：queued 或认领已过期的 running，按优先级 + 等待时间排序。
+    认领过期的任务同样受 QUEUE_MAX_ATTEMPTS 限制，次数用完的由 dead_letter_expired 送进死信。
+    max_priority 用于预留 worker，只认领不低于该优先级的任务。
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            f"""
+            SELECT job_id, payload FROM job_queue
+            WHERE ((status = 'queued' AND available_at <= ?)
+                   OR (status = 'running' AND claimed_until < ? AND attempts < ?))
+              AND priority <= ?
+            ORDER BY {_ORDER_BY}
+            LIMIT 1
+            """,
+            (now, now, QUEUE_MAX_ATTEMPTS, QUEUE_PRIORITY_BULK if max_priority is None else max_priority),
+        ).fetchone()
+        if not row:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            "UPDATE job_queue SET status = 'running', claimed_until = ?, attempts = attempts + 1 WHERE job_id = ?",
+            (now + QUEUE_VISIBILITY_TIMEOUT, row[0]),
+        )
+        conn.execute("COMMIT")
+        return json.loads(row[1])
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def dead_letter_expired() -> list[dict]:
+    """
+    认领过期且次数已用完的任务 (worker 每次跑到一半就挂) 直接进死信，不再重新投递。
+    返回这些任务的 payload，调用方负责记日志和通知。
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT job_id, payload FROM job_queue WHERE status = 'running' AND claimed_until < ? AND attempts >= ?",
+            (now, QUEUE_MAX_ATTEMPTS),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE job_queue SET status = 'dead', finished_at = ?, claimed_until = NULL, error = ? WHERE job_id = ?",
+            [(now, "认领超时：worker 多次中途退出", job_id) for job_id, _ in rows],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return [json.loads(payload) for _, payload in rows]
+
+
+def extend_claim(job_id: str):
+    """续约：长任务 (例如在排队等 LLM) 期间定期调用，防止被别的 worker 重复认领"""
+    conn = _connect()
+    conn.execute(
+        "UPDATE job_queue SET claimed_until = ? WHERE job_id = ? AND status = 'running'",
+        (time.time() + QUEUE_VISIBILITY_TIMEOUT, job_id),
+    )
+    conn.close()
+
+
+def ack(job_id: str):
+    conn = _connect()
+    conn.execute(
+        "UPDATE job_queue SET status = 'done', finished_at = ?, claimed_until = NULL, error = NULL WHERE job_id = ?",
+        (time.time(), job_id),
+    )
+    conn.execute("DELETE FROM job_checkpoints WHERE job_id = ?", (job_id,))
+    conn.close()
+
+
+def retry_or_dead(job_id: str, error: str) -> tuple[str, int]:
+    """
+    失败处理：还有次数就按指数退避重新排队，否则进死信。
+    返回 (新状态, 退避秒数)。检查点保留，重试会跳过已完成的阶段。
+    """
+    now = time.time()
+    conn = _connect()
+    row = conn.execute("SELECT attempts FROM job_queue WHERE job_id = ?", (job_id,)).fetchone()
+    attempts = row[0] if row else QUEUE_MAX_ATTEMPTS
+    if attempts < QUEUE_MAX_ATTEMPTS:
+        delay = min(QUEUE_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), QUEUE_RETRY_MAX_DELAY)
+        conn.execute(
+            "UPDATE job_queue SET status = 'queued', available_at = ?, claimed_until = NULL, error = ? WHERE job_id = ?",
+            (now + delay, error, job_id),
+        )
+        status = "queued"
+    else:
+        delay = 0
+        conn.execute(
+            "UPDATE job_queue SET status = 'dead', finished_at = ?, claimed_until = NULL, error = ? WHERE job_id = ?",
+            (now, error, job_id),
+        )
+        status = "dead"
+    conn.close()
+    return status, delay
+
+
+def requeue(job_id: str) -> bool:
+    """手动重试死信任务：重置次数，立即可认领 (检查点仍然有效)"""
+    conn = _connect()
+    cur = conn.execute(
+        "UPDATE job_queue SET status = 'queued', attempts = 0, available_at = 0, finished_at = NULL "
+        "WHERE job_id = ? AND status = 'dead'",
+        (job_id,),
+    )
+    conn.close()
+    if cur.rowcount:
+        _notify()
+    return cur.rowcount > 0
+
+
+def get_job(job_id: str) -> dict | None:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT job_id, user_id, source, status, attempts, error FROM job_queue WHERE job_id = ?",
+        (job_id,),
+    ).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {"job_id": row[0], "user_id": row[1], "source": row[2], "status": row[3], "attempts": row[4], "error": row[5]}
+
+
+def save_checkpoint(job_id: str, stage: str, data: dict):
+    conn = _connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO job_checkpoints (job_id, stage, data, updated_at) VALUES (?, ?, ?, ?)",
+        (job_id, stage, json.dumps(data, ensure_ascii=False), time.time()),
+    )
+    conn.close()
+
+
+def load_checkpoint(job_id: str, stage: str) -> dict | None:
+    conn = _connect()
+    row = conn.execute(
+        "SELECT data FROM job_checkpoints WHERE job_id = ? AND stage = ?", (job_id, stage)
+    ).fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def list_queued() -> list[str]:
+    conn = _connect()
+    rows = conn.execute(
+        f"SELECT job_id FROM job_queue WHERE status = 'queued' ORDER BY {_ORDER_BY}"
+    ).fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+
+def active_counts(user_id: str, priority: int | None = None) -> tuple[int, int]:
+    """(全局, 该用户) queued + running 的任务数；给了 priority 时用户那一项只算这条通道"""
+    conn = _connect()
+    if priority is None:
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(user_id = ?), 0) FROM job_queue WHERE status IN ('queued', 'running')",
+            (user_id,),
+        ).fetchone()
+    else:
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(user_id = ? AND priority = ?), 0) FROM job_queue "
+            "WHERE status IN ('queued', 'running')",
+            (user_id, priority),
+        ).fetchone()
+    conn.close()
+    return row[0], row[1]
+
+
+def queue_position(job_id: str) -> int | None:
+    """排队中的任务前面还有几个 (按调度顺序，1 表示下一个就轮到)；不在排队返回 None"""
+    conn = _connect()
+    row = conn.execute(
+        f"SELECT {_ORDER_BY} FROM job_queue WHERE job_id = ? AND status = 'queued'", (job_id,)
+    ).fetchone()
+    if not row:
+        conn.close()
+        return None
+    # 还在退避等待 (available_at 在未来) 的任务 claim 拿不到，不算排在前面
+    ahead = conn.execute(
+        f"SELECT COUNT(*) FROM job_queue WHERE status = 'queued' AND available_at <= ? AND {_ORDER_BY} < ?",
+        (time.time(), row[0]),
+    ).fetchone()[0]
+    conn.close()
+    return ahead + 1
+
+
+def queue_depths() -> list[tuple[str, int, int]]:
+    """(status, priority, count)，供 /metrics 使用"""
+    conn = _connect()
+    rows = conn.execute(
+        "SELECT status, priority, COUNT(*) FROM job_queue WHERE status IN ('queued', 'running', 'dead') "
+        "GROUP BY status, priority"
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def purge_finished(retention_days: int = QUEUE_DONE_RETENTION_DAYS) -> int:
+    """清理过期的已完成任务 (dead 保留，方便排查和手动重试)"""
+    cutoff = time.time() - retention_days * 86400
+    conn = _connect()
+    cur = conn.execute("DELETE FROM job_queue WHERE status = 'done' AND finished_at < ?", (cutoff,))
+    conn.execute("DELETE FROM job_checkpoints WHERE job_id NOT IN (SELECT job_id FROM job_queue)")
+    conn.close()
+    return cur.rowcount
@@ -1,12 +1,125 @@
-import os
-import json
 import time
-from config import JOBS_LOG_PATH
+import queue
+import atexit
+import threading
+from collections import OrderedDict
+from config import (
+    JOB_STATUS_CACHE_SIZE, JOB_STATUS_BOOTSTRAP_BYTES,
+    JOB_LOG_DURABILITY, JOB_LOG_FSYNC_INTERVAL, JOB_LOG_QUEUE_SIZE,
+)
+from utils import job_log
+
+_status_lock = threading.Lock()
+_status_index: OrderedDict = OrderedDict()
+_status_loaded = False
+_subscribers: dict[str, set] = {}  # job_id -> {(loop, asyncio.Queue)}
 
 def now_iso() -> str:
     return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
 
-import os # 确保引入 os
+class _GroupCommitWriter:
+    """
+    后台写日志：攒一批再写，一批只 fsync 一次。
+    每 JOB_LOG_FSYNC_INTERVAL 秒或遇到终态事件 (SUCCESS/FAILED) 时落盘。
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=JOB_LOG_QUEUE_SIZE)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        # 后台线程从取出一批到写完都持有这把锁，同步兜底写拿到锁时不会有“取出未写”的事件，保证顺序
+        self._write_lock = threading.Lock()
+        self._pressure = threading.Event()   # 有同步兜底在等锁：后台线程别再攒批，尽快写完放锁
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="job-log-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, rec: dict):
+        """事件循环里调用，不能阻塞：入队失败就同步写"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((rec, job_log.is_terminal(rec["status"])))
+        except queue.Full:
+            # 队列积压说明磁盘跟不上，退化为同步写，保证不丢也不乱序
+            self._write_through([rec])
+
+    def _write_through(self, tail: list[dict]):
+        """把队列里排着的事件连同 tail 按顺序同步写掉"""
+        self._pressure.set()
+        with self._write_lock:
+            self._pressure.clear()
+            batch, waiters = [], []
+            while True:
+                try:
+                    rec, flag = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if rec is None:
+                    waiters.append(flag)
+                else:
+                    batch.append(rec)
+            batch.extend(tail)
+            try:
+                if batch:
+                    job_log.append_records(batch, sync=JOB_LOG_DURABILITY != "none")
+            except Exception as e:
+                print(f"❌ 日志写入失败: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中已提交的事件全部落盘"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            self._write_through([])
+            return
+        done.wait(timeout)
+
+    def _run(self):
+        while True:
+            with self._write_lock:
+                try:
+                    rec, flag = self._queue.get(timeout=JOB_LOG_FSYNC_INTERVAL)
+                except queue.Empty:
+                    continue
+                batch, waiters = [], []
+                deadline = time.monotonic() + JOB_LOG_FSYNC_INTERVAL
+                while True:
+                    if rec is None:
+                        waiters.append(flag)
+                        break
+                    batch.append(rec)
+                    if flag or self._pressure.is_set():  # 终态事件或有人等着兜底写：立即落盘
+                        break
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        rec, flag = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                try:
+                    if batch:
+                        job_log.append_records(batch, sync=JOB_LOG_DURABILITY != "none")
+                except Exception as e:
+                    print(f"❌ 日志写入失败: {e}")
+                for waiter in waiters:
+                    waiter.set()
+
+_writer = _GroupCommitWriter()
+
+def flush_job_log():
+    _writer.flush()
+
+atexit.register(flush_job_log)
 
 def append_job_event(job_id: str, status: str, *, step: str = "", url: str = "", user_id: str = "",
                      message: str = "", error: str | None = None, extra: dict | None = None):
@@ -22,50 +135,103 @@ def append_job_event(job_id: str, status: str, *, step: str = "", url: str = "",
     }
     if extra:
         rec["extra"] = extra
-    
+
+    # 状态索引同步更新，查询立即可见；落盘交给后台线程攒批
+    load_status_index()
+    _remember(rec)
+    _publish(rec)
+
+    if JOB_LOG_DURABILITY == "always":
+        try:
+            job_log.append_records([rec], sync=True)
+        except Exception as e:
+            print(f"❌ 日志写入失败: {e}")
+        return
+    _writer.submit(rec)
+
+# ✨ 状态索引：job_id -> 最新状态，查询 O(1)；jobs.jsonl 只作为审计日志
+def _summarize(entry: dict) -> dict:
+    return {
+        "status": entry.get("status", "UNKNOWN"),
+        "step": entry.get("step", ""),
+        "message": entry.get("message", ""),
+        "error": entry.get("error", "")
+    }
+
+def _remember(entry: dict):
+    job_id = entry.get("job_id")
+    if not job_id:
+        return
+    with _status_lock:
+        _status_index[job_id] = _summarize(entry)
+        _status_index.move_to_end(job_id)
+        while len(_status_index) > JOB_STATUS_CACHE_SIZE:
+            _status_index.popitem(last=False)
+
+def load_status_index():
+    """
+    初始化分段日志 (建索引库、迁移旧版 jobs.jsonl)，再从最新分段尾部回放重建状态索引。
+    启动时调用一次，之后由 append_job_event 增量维护。
+    """
+    global _status_loaded
+    with _status_lock:
+        if _status_loaded:
+            return
+        _status_loaded = True
     try:
-        log_dir = os.path.dirname(JOBS_LOG_PATH)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        with open(JOBS_LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
-            # ✨ 新增：强制刷盘，防止延迟
-            f.flush()
-            os.fsync(f.fileno()) 
+        job_log.init_index_db()
+        migrated = job_log.migrate_legacy_log()
+        if migrated:
+            print(f"♻️ 旧版 jobs.jsonl 已迁移到分段日志: {migrated} 条")
+        for entry in job_log.iter_tail_records(JOB_STATUS_BOOTSTRAP_BYTES):
+            _remember(entry)
     except Exception as e:
-        print(f"❌ 日志写入失败: {e}")
+        print(f"⚠️ 状态索引重建失败: {e}")
+
+# ✨ 推送：SSE 订阅某个 job 的状态变化 (append_job_event 可能在线程池里调用，要跨线程投递)
+def subscribe_job(job_id: str, loop, q):
+    with _status_lock:
+        _subscribers.setdefault(job_id, set()).add((loop, q))
+
+def unsubscribe_job(job_id: str, loop, q):
+    with _status_lock:
+        subs = _subscribers.get(job_id)
+        if subs:
+            subs.discard((loop, q))
+            if not subs:
+                _subscribers.pop(job_id, None)
+
+def _publish(rec: dict):
+    with _status_lock:
+        subs = list(_subscribers.get(rec["job_id"], ()))
+    if not subs:
+        return
+    summary = _summarize(rec)
+    for loop, q in subs:
+        try:
+            loop.call_soon_threadsafe(q.put_nowait, summary)
+        except RuntimeError:
+            pass
 
-# ✨ 新增：用于前端查询任务状态
 def get_job_latest_status(job_id: str):
-    """
-    倒序读取日志文件，查找指定 Job ID 的最新状态
-    """
-    if not os.path.exists(JOBS_LOG_PATH):
-        return {"status": "PENDING", "step": "queue", "message": "日志文件未生成"}
+    """查询指定 Job ID 的最新状态：先查内存索引，未命中再按 job_id 索引定位分段偏移"""
+    load_status_index()
+    with _status_lock:
+        found = _status_index.get(job_id)
+    if found:
+        return dict(found)
 
-    found_entry = None
     try:
-        with open(JOBS_LOG_PATH, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            # 倒序查找，效率最高
-            for line in reversed(lines):
-                try:
-                    entry = json.loads(line)
-                    if entry.get("job_id") == job_id:
-                        found_entry = entry
-                        break 
-                except:
-                    continue
+        entry = job_log.latest_record(job_id)
     except Exception:
-        pass
-
-    if found_entry:
-        return {
-            "status": found_entry.get("status", "UNKNOWN"),
-            "step": found_entry.get("step", ""),
-            "message": found_entry.get("message", ""),
-            "error": found_entry.get("error", "")
-        }
+        entry = None
+    if entry:
+        _remember(entry)
+        return _summarize(entry)
     
-    return {"status": "PENDING", "step": "queue", "message": "排队中..."}
\ No newline at end of file
+    return {"status": "PENDING", "step": "queue", "message": "排队中..."}
+
+def tail_job_events(limit: int = 30) -> list[dict]:
+    """最近的事件，新的在前"""
+    flush_job_log()
+    return job_log.tail_records(limit)
@@ -0,0 +1,173 @@
+# 轻量 Prometheus 指标 (文本格式 0.0.4)，不依赖 prometheus_client
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_registry: list = []
+_collectors: list = []
+
+
+def _label_str(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{str(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: dict = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(k, "") for k in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """抓取时同步外部维护的累计值 (例如执行器池里只增不减的计数)"""
+        with _lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def clear(self):
+        with _lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def mean(self, **labels) -> float | None:
+        with _lock:
+            state = self._values.get(self._key(labels))
+            if not state or not state["count"]:
+                return None
+            return state["sum"] / state["count"]
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            for key, state in sorted(self._values.items()):
+                for bound, n in zip(self.buckets, state["counts"]):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {n}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {state['count']}")
+                lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {round(state['sum'], 6)}")
+                lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+def register_collector(fn):
+    """注册抓取时回调 (例如刷新队列深度这类需要现查的 Gauge)"""
+    _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    for fn in _collectors:
+        try:
+            fn()
+        except Exception as e:
+            print(f"⚠️ 指标采集失败: {e}")
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# === 全局指标定义 ===
+STAGE_SECONDS = Histogram("kb_stage_duration_seconds", "Ingestion stage latency", ("stage",))
+JOB_SECONDS = Histogram("kb_job_duration_seconds", "End-to-end ingestion job latency", ("result",))
+JOBS_TOTAL = Counter("kb_jobs_total", "Finished ingestion jobs", ("result",))
+JOBS_IN_FLIGHT = Gauge("kb_jobs_in_flight", "Ingestion jobs currently being processed")
+QUEUE_DEPTH = Gauge("kb_queue_depth", "Jobs in the queue by status and priority", ("status", "priority"))
+RETRIEVAL_SECONDS = Histogram("kb_retrieval_duration_seconds", "hybrid_search latency", ("part",),
+                              buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+LLM_SECONDS = Histogram("kb_llm_request_duration_seconds", "LLM request latency", ("caller",))
+LLM_TOKENS = Counter("kb_llm_tokens_total", "LLM tokens processed", ("caller", "kind"))
+LLM_TOKENS_PER_SECOND = Histogram("kb_llm_completion_tokens_per_second", "LLM completion throughput", ("caller",),
+                                  buckets=(1, 2, 5, 10, 20, 30, 50, 80, 120, 200))
+LLM_QUEUE_SECONDS = Histogram("kb_llm_queue_wait_seconds", "Time LLM requests waited for a gateway slot",
+                              ("caller", "priority"))
+LLM_INFLIGHT = Gauge("kb_llm_inflight", "LLM requests holding a gateway slot", ("priority",))
+LLM_REQUESTS = Counter("kb_llm_requests_total", "LLM gateway requests by outcome", ("caller", "result"))
+LLM_FIRST_TOKEN_SECONDS = Histogram("kb_llm_time_to_first_token_seconds",
+                                    "Streamed LLM latency from enqueue to first token", ("caller",),
+                                    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+POOL_INFLIGHT = Gauge("kb_pool_inflight", "Executor pool tasks in flight", ("pool",))
+POOL_TASKS = Counter("kb_pool_tasks_total", "Executor pool tasks by outcome", ("pool", "result"))
+CRAWL_CACHE_REQUESTS = Counter("kb_crawl_cache_requests_total", "Crawl cache lookups by outcome", ("kind", "result"))
+CRAWL_THROTTLE_SECONDS = Histogram("kb_crawl_throttle_wait_seconds", "Time spent waiting on crawl rate limits",
+                                   ("kind",), buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120))
+CRAWL_BLOCKED = Counter("kb_crawl_blocked_total", "Anti-bot or 429 responses that triggered a host cooldown", ("kind",))
+CRAWL_HEDGE_RESULTS = Counter("kb_crawl_hedge_total", "Hedged crawl outcomes by winning fetcher",
+                              ("winner", "hedged"))
+EXTRACT_SECONDS = Histogram("kb_extract_duration_seconds", "HTML parse + extraction time per extractor",
+                            ("extractor",), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+EXTRACT_FALLBACKS = Counter("kb_extract_fallback_total", "Site extractor misses that fell back to trafilatura",
+                            ("extractor",))
+CRAWL_CACHE_BYTES = Gauge("kb_crawl_cache_bytes", "Compressed bytes stored in the crawl cache")
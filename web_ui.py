@@ -12,16 +12,15 @@ from chromadb.utils import embedding_functions
 from config import (
     CHROMA_DB_PATH,        # 确保 config.py 里是 CHROMA_PATH
     CHROMA_COLLECTION_NAME,
-    LLM_API_URL,
-    LLM_MODEL,
     OBSIDIAN_ROOT,
     KNOWLEDGE_STORE_ROOT,
     SPECIAL_USER,
     EMBEDDING_MODEL_NAME,
     EMBEDDING_API_URL,
-    JOBS_LOG_PATH       # 确保 config.py 里有 JOBS_LOG_PATH = "logs/jobs.jsonl"
+    JOBS_LOG_DIR        # 分段日志目录 data/jobs/
 )
 from core.retriever import hybrid_search
+from utils.job_log import tail_records
 
 # === 2. 页面初始化 ===
 st.set_page_config(page_title="Knowledge OS", page_icon="🧠", layout="wide")
@@ -79,30 +78,128 @@ def _clear_query_params():
     except Exception:
         st.experimental_set_query_params()
 
+# === 任务进度 (SSE 推送，替代原来的 40 次轮询) ===
+STEP_LABELS = {
+    "worker_pick": "工人接单",
+    "resume_crawl": "复用已抓取内容",
+    "resume_ai": "复用已有 AI 分析",
+    "crawl_local": "本地爬虫抓取",
+    "crawl_jina": "云端 Jina 解析",
+    "save_vector_start": "开始向量化",
+    "save_vector_success": "向量化完成",
+    "done": "全部完成",
+}
+
+def stream_job_events(job_id: str):
+    """逐条产出 /api/status/{job_id}/stream 推送的状态，服务端在终态后关闭连接"""
+    timeout = httpx.Timeout(5.0, read=60.0)  # 服务端每 15s 发一次心跳
+    with httpx.stream("GET", f"http://localhost:8888/api/status/{job_id}/stream", timeout=timeout) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line.startswith("data:"):
+                yield json.loads(line[5:].strip())
+
+def follow_job_progress(job_id: str) -> dict | None:
+    """在 st.status 里实时展示任务进度，返回终态信息；连接中断/超时返回 None"""
+    final = None
+    with st.status("🚀 任务提交成功，处理中...", expanded=True) as status_box:
+        st.write(f"Job ID: `{job_id}`")
+        last_step_seen = None
+        last_position = None
+        try:
+            for info in stream_job_events(job_id):
+                status = info.get("status") or ""
+                step = info.get("step") or ""
+
+                position = info.get("queue_position")
+                if position and position != last_position:
+                    st.write(f"⏳ 排队中，前面还有 {position - 1} 个任务")
+                    last_position = position
+
+                if status == "RETRYING":
+                    st.write(f"🔁 处理失败，稍后自动重试: {info.get('error') or info.get('message')}")
+                elif step and step != last_step_seen:
+                    st.write(f"🔄 {STEP_LABELS.get(step, step)}...")
+                last_step_seen = step
+
+                if "SUCCESS" in status:
+                    status_box.update(label="✅ 处理完成！", state="complete", expanded=False)
+                    if status == "SUCCESS_NOTIFY_FAIL":
+                        st.warning(f"入库成功，但微信通知失败: {info.get('message')}")
+                    else:
+                        st.success(f"成功: {info.get('message')}")
+                    final = info
+                    break
+                if "FAIL" in status:
+                    status_box.update(label="❌ 失败", state="error")
+                    st.error(info.get("error"))
+                    final = info
+                    break
+        except Exception:
+            # ⚠️ 只能捕获 Exception，不能写 bare except，否则会吞掉 Streamlit 的中断信号
+            pass
+        if final is None:
+            status_box.update(label="⚠️ 后台运行中 (请稍后在阅览室查看)", state="running")
+    return final
+
+
 # === 4. 核心逻辑函数 (保留原版高级逻辑) ===
 
+def backend_llm(messages, temperature=0.7, max_tokens=None, caller="ui_chat", timeout=120):
+    """经后端 LLM 网关调用 (interactive 优先级，和入库分析共用并发槽位)，返回回答文本"""
+    payload = {"messages": messages, "temperature": temperature, "caller": caller}
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    resp = httpx.post("http://localhost:8888/api/llm/chat", json=payload, headers=auth_headers(), timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()["content"]
+
+def backend_llm_stream(messages, temperature=0.7, max_tokens=None, caller="ui_chat", timeout=120):
+    """流式版 backend_llm：逐段产出 /api/llm/chat/stream 推来的文本增量"""
+    payload = {"messages": messages, "temperature": temperature, "caller": caller}
+    if max_tokens:
+        payload["max_tokens"] = max_tokens
+    with httpx.stream("POST", "http://localhost:8888/api/llm/chat/stream", json=payload,
+                      headers=auth_headers(), timeout=httpx.Timeout(10.0, read=timeout)) as resp:
+        resp.raise_for_status()
+        event = ""
+        for line in resp.iter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[5:].strip())
+                if event == "token":
+                    yield data["text"]
+                elif event == "error":
+                    raise RuntimeError(data.get("detail"))
+
+def render_stream(placeholder, chunks, prefix=""):
+    """边收边渲染到 placeholder (约 20 次/秒刷新)，返回完整文本"""
+    text = ""
+    last = 0.0
+    for piece in chunks:
+        text += piece
+        now = time.monotonic()
+        if now - last >= 0.05:
+            placeholder.markdown(prefix + text + "▌")
+            last = now
+    placeholder.markdown(prefix + text)
+    return text
+
 def detect_intent_with_llm(query, last_topic):
     """使用 LLM 判断是否是追问"""
     if not last_topic: return False
     
     system_prompt = "你是一个对话意图分类器。判断【当前问题】是否是针对【上轮话题】的追问。如果是追问/指代，输出TRUE；否则输出FALSE。"
     user_prompt = f"上轮话题：{last_topic}\n当前问题：{query}"
-    
-    payload = {
-        "model": LLM_MODEL,
-        "temperature": 0.1,
-        "max_tokens": 10,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-    }
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
     
     try:
-        resp = httpx.post(LLM_API_URL, json=payload, timeout=10)
-        data = resp.json()
-        result = data['choices'][0]['message']['content'].strip().upper()
-        return "TRUE" in result
+        result = backend_llm(messages, temperature=0.1, max_tokens=10, caller="ui_intent", timeout=15)
+        return "TRUE" in result.strip().upper()
     except Exception as e:
         st.warning(f"意图识别失败: {e}")
         return False
@@ -332,19 +429,14 @@ if page_mode == "🖥️ 系统日志":
     st.title("🖥️ 系统运行日志")
     if st.button("🔄 刷新日志"): st.rerun()
 
-    if os.path.exists(JOBS_LOG_PATH):
-        logs = []
-        try:
-            with open(JOBS_LOG_PATH, "r", encoding="utf-8") as f:
-                lines = f.readlines()[-30:][::-1] # 取最后30条
-                for line in lines:
-                    if not line.strip(): continue
-                    try: logs.append(json.loads(line))
-                    except: logs.append({"raw": line})
-        except Exception as e:
-            st.error(f"读取日志失败: {e}")
-            st.stop()
+    logs = []
+    try:
+        logs = tail_records(30) # 取最后30条 (新的在前)
+    except Exception as e:
+        st.error(f"读取日志失败: {e}")
+        st.stop()
 
+    if logs:
         for log in logs:
             if "raw" in log:
                 st.text(log["raw"])
@@ -369,7 +461,7 @@ if page_mode == "🖥️ 系统日志":
                 st.markdown(f"**Status**: :{color}[{status}] | **Job ID**: `...{job_id}`")
                 if log.get("extra"): st.json(log["extra"])
     else:
-        st.warning(f"📭 暂无日志文件: {JOBS_LOG_PATH}")
+        st.warning(f"📭 暂无日志: {JOBS_LOG_DIR}")
     
     st.stop() # 停止渲染下面的聊天界面
 
@@ -541,7 +633,7 @@ with st.sidebar:
             except Exception as e:
                 st.error(f"生成失败: {e}")
 
-    # 3. ✨ 速记/存链接 (已集成新版轮询逻辑) ✨
+    # 3. ✨ 速记/存链接 (进度走 SSE 推送) ✨
     with st.expander("📥 速记 / 存链接", expanded=True):
         categories = list_custom_categories(USER_ROOT)
         with st.form("ingest_form", clear_on_submit=True):
@@ -571,67 +663,12 @@ with st.sidebar:
                     if resp.status_code == 200:
                         job_id = resp.json().get("job_id")
                         
-                        # 轮询状态
-                        with st.status("🚀 任务提交成功，处理中...", expanded=True) as status_box:
-                            st.write(f"Job ID: `{job_id}`")
-                            
-                            # ✨ 关键变量：记录上一步的状态，用于去重
-                            last_step_seen = None 
-                            
-                            for _ in range(40): # 等待 60s
-                                time.sleep(1.5)
-                                # --- 核心修复开始 ---
-                                # 1. 初始化变量，防止 try 失败后变量未定义
-                                info = {}
-                                status = "UNKNOWN"
-                                step = ""
-                                
-                                try:
-                                    r_stat = httpx.get(f"http://localhost:8888/api/status/{job_id}", timeout=3)
-                                    if r_stat.status_code == 200:
-                                        info = r_stat.json()
-                                        status = info.get("status")
-                                        step = info.get("step")
-                                except Exception: 
-                                    # ⚠️ 只能捕获 Exception，绝对不能写 bare except (即不能写 "except:")
-                                    # 否则会把 st.rerun() 的中断信号也吞掉！
-                                    pass
-
-                                # 2. 更新显示逻辑 (放在 try 外面更安全)
-                                if step and step != last_step_seen:
-                                    step_map = {
-                                        "worker_pick": "工人接单",
-                                        "crawl_local": "本地爬虫抓取",
-                                        "crawl_jina": "云端 Jina 解析",
-                                        "save_vector_start": "开始向量化",
-                                        "save_vector_success": "向量化完成",
-                                        "done": "全部完成"
-                                    }
-                                    display_step = step_map.get(step, step)
-                                    st.write(f"🔄 {display_step}...")
-                                    last_step_seen = step
-
-                                # 3. 判断结束条件
-                                if status and "SUCCESS" in status:
-                                    status_box.update(label="✅ 处理完成！", state="complete", expanded=False)
-                                    
-                                    if status == "SUCCESS_NOTIFY_FAIL":
-                                        st.warning(f"入库成功，但微信通知失败: {info.get('message')}")
-                                    else:
-                                        st.success(f"成功: {info.get('message')}")
-                                    
-                                    # 给用户 1 秒钟看一眼成功的提示
-                                    time.sleep(1)
-                                    # 🚀 这行代码现在能正常工作了，因为它在 try...except 之外
-                                    st.rerun() 
-                                    
-                                elif status and "FAIL" in status:
-                                    status_box.update(label="❌ 失败", state="error")
-                                    st.error(info.get("error"))
-                                    # 失败了通常不需要 rerun，停在这里让用户看报错
-                                    break
-                            else:
-                                status_box.update(label="⚠️ 后台运行中 (请稍后在阅览室查看)", state="running")
+                        # 进度由后端 SSE 推送
+                        info = follow_job_progress(job_id)
+                        if info and "SUCCESS" in info.get("status", ""):
+                            # 给用户 1 秒钟看一眼成功的提示
+                            time.sleep(1)
+                            st.rerun()
                 except Exception as e:
                     st.error(f"连接失败: {e}")
             elif sub_category and note_content.strip():
@@ -661,50 +698,10 @@ with st.sidebar:
                         )
                         if resp.status_code == 200:
                             job_id = resp.json().get("job_id")
-                            with st.status("🚀 任务提交成功，处理中...", expanded=True) as status_box:
-                                st.write(f"Job ID: `{job_id}`")
-                                last_step_seen = None
-                                for _ in range(40):
-                                    time.sleep(1.5)
-                                    info = {}
-                                    status = "UNKNOWN"
-                                    step = ""
-                                    try:
-                                        r_stat = httpx.get(f"http://localhost:8888/api/status/{job_id}", timeout=3)
-                                        if r_stat.status_code == 200:
-                                            info = r_stat.json()
-                                            status = info.get("status")
-                                            step = info.get("step")
-                                    except Exception:
-                                        pass
-
-                                    if step and step != last_step_seen:
-                                        step_map = {
-                                            "worker_pick": "工人接单",
-                                            "crawl_local": "本地爬虫抓取",
-                                            "crawl_jina": "云端 Jina 解析",
-                                            "save_vector_start": "开始向量化",
-                                            "save_vector_success": "向量化完成",
-                                            "done": "全部完成"
-                                        }
-                                        display_step = step_map.get(step, step)
-                                        st.write(f"🔄 {display_step}...")
-                                        last_step_seen = step
-
-                                    if status and "SUCCESS" in status:
-                                        status_box.update(label="✅ 处理完成！", state="complete", expanded=False)
-                                        if status == "SUCCESS_NOTIFY_FAIL":
-                                            st.warning(f"入库成功，但微信通知失败: {info.get('message')}")
-                                        else:
-                                            st.success(f"成功: {info.get('message')}")
-                                        time.sleep(1)
-                                        st.rerun()
-                                    elif status and "FAIL" in status:
-                                        status_box.update(label="❌ 失败", state="error")
-                                        st.error(info.get("error"))
-                                        break
-                                else:
-                                    status_box.update(label="⚠️ 后台运行中 (请稍后在阅览室查看)", state="running")
+                            info = follow_job_progress(job_id)
+                            if info and "SUCCESS" in info.get("status", ""):
+                                time.sleep(1)
+                                st.rerun()
                         else:
                             st.error(resp.json().get("detail", "提交失败"))
                     except Exception as e:
@@ -949,18 +946,12 @@ else:
 
                     if not documents:
                         # 无知识库命中时，直接用通用模型回答
-                        payload = {
-                            "model": LLM_MODEL,
-                            "messages": [
-                                {"role": "system", "content": "你是一个有用的助手。"},
-                                {"role": "user", "content": user_input}
-                            ],
-                            "temperature": 0.7
-                        }
+                        messages = [
+                            {"role": "system", "content": "你是一个有用的助手。"},
+                            {"role": "user", "content": user_input}
+                        ]
                         try:
-                            resp = httpx.post(LLM_API_URL, json=payload, timeout=60)
-                            data = resp.json()
-                            full_response = data['choices'][0]['message']['content']
+                            full_response = render_stream(placeholder, backend_llm_stream(messages, temperature=0.7))
                         except Exception as e:
                             full_response = f"❌ LLM 调用失败: {e}"
                     else:
@@ -971,18 +962,16 @@ else:
 
                         # (3) 纠偏式回答：先自由回答，再用知识库校正
                         context_str = "\n\n".join(context_parts)
-                        draft_payload = {
-                            "model": LLM_MODEL,
-                            "messages": [
-                                {"role": "system", "content": "你是一个有用的助手。回答请更详细，至少3段，包含关键背景、现状与影响。"},
-                                {"role": "user", "content": user_input}
-                            ],
-                            "temperature": 0.7
-                        }
+                        draft_messages = [
+                            {"role": "system", "content": "你是一个有用的助手。回答请更详细，至少3段，包含关键背景、现状与影响。"},
+                            {"role": "user", "content": user_input}
+                        ]
                         try:
-                            draft_resp = httpx.post(LLM_API_URL, json=draft_payload, timeout=60)
-                            draft_data = draft_resp.json()
-                            draft_answer = draft_data['choices'][0]['message']['content']
+                            # 初稿先流式显示，用户不用干等纠偏结果
+                            draft_answer = render_stream(
+                                placeholder, backend_llm_stream(draft_messages, temperature=0.7),
+                                prefix="📝 *初稿 (知识库校对中...)*\n\n",
+                            )
                         except Exception as e:
                             draft_answer = f"❌ LLM 调用失败: {e}"
 
@@ -995,18 +984,12 @@ else:
                             f"\n【初稿回答】:\n{draft_answer}\n"
                             f"\n【知识库片段】:\n{context_str}\n"
                         )
-                        revise_payload = {
-                            "model": LLM_MODEL,
-                            "messages": [
-                                {"role": "system", "content": correction_prompt},
-                                {"role": "user", "content": user_input}
-                            ],
-                            "temperature": 0.3
-                        }
+                        revise_messages = [
+                            {"role": "system", "content": correction_prompt},
+                            {"role": "user", "content": user_input}
+                        ]
                         try:
-                            revise_resp = httpx.post(LLM_API_URL, json=revise_payload, timeout=60)
-                            revise_data = revise_resp.json()
-                            full_response = revise_data['choices'][0]['message']['content']
+                            full_response = render_stream(placeholder, backend_llm_stream(revise_messages, temperature=0.3))
                         except Exception as e:
                             full_response = f"❌ LLM 调用失败: {e}"
 